@@ -21,9 +21,12 @@ import csv
 import sqlite3
 
 from SolrClient import SolrClient
+from SolrClient import SolrError
 from TaggingProcessor import TaggingProcessor
 from util import TermUtil
 from FileUtil import path_leaf
+from subsumption_index import SubsumptionIndex
+from candidate_store import CandidateStore
 
 import math
 from multiprocPool import MultiprocPool
@@ -169,19 +172,24 @@ class IndustryTermRecogniser(object):
         ranked_term_tuple_list = c_value_algorithm.process(tagging=self.tagging)
 
         self._logger.info("filtering ranked term candidate list by cut-off threshold [%s]", self.cut_off_threshold)
-        final_term_set = [term_tuple[0] for term_tuple in ranked_term_tuple_list if
-                          term_tuple[1] > self.cut_off_threshold]
+        # hashed set for membership test of every candidate of every document
+        final_term_set = frozenset(term_tuple[0] for term_tuple in ranked_term_tuple_list if
+                                   term_tuple[1] > self.cut_off_threshold)
 
         self._logger.info("final term size after cut-off [%s]", str(len(final_term_set)))
 
         self.final_term_set_indexing(final_term_set)
         term_db_path = self.save_ranked_candidates_to_db(self.solrClient.solr_core, ranked_term_tuple_list)
         if self.export_term_candidates:
-            self.export_ranked_terms_to_csv(term_db_path)
+            self.export_ranked_terms_to_csv(term_db_path, ranked_term_tuple_list)
         else:
             self._logger.info("skip exporting term candidates from Solr.")
 
         self.synonym_aggregation(final_term_set)
+        self._logger.info("HTTP transport connection reuse: %s", self.solrClient.transport_stats())
+        self._logger.info("normalised term cache: %s", self.solrClient.normalised_term_cache_stats())
+        self._logger.info("candidate extraction cache: %s",
+                          c_value_algorithm.taggingProcessor.candidate_extraction_cache_stats())
         self._logger.info("terminology recognition and tagging are completed.")
 
     def final_term_set_indexing(self, final_term_set):
@@ -193,44 +201,56 @@ class IndustryTermRecogniser(object):
 
         self._logger.info("total document size for final industry term tagging [%s]" % totalDocSize)
 
-        rows = 10
+        rows = self.solrClient.scan_page_size
         self._logger.info("starting candidate term tagging in batch size [%s]" % rows)
 
-        for nextCursor in range(0, totalDocSize, rows):
-            result = self.solrClient.load_documents(nextCursor, rows)
-            docs = result['docs']
+        # only the documents tagged with candidates, and only the fields required for final term tagging
+        query_condition = '%s:[* TO *]' % FIELD_TERM_CANDIDATES
+        fl = [self.solrClient.field_doc_id, FIELD_TERM_CANDIDATES]
+        if self.index_dict_term_with_industry_term:
+            fl.append(FIELD_DICTIONARY_TERM)
 
-            # TODO: parallel annotation
-            cur_docs_to_commits = []
-            for doc in docs:
+        with self.solrClient.update_buffer() as updates:
+            nextCursor = 0
+            for docs in self.solrClient.scan_document_pages(query_condition=query_condition, fl=fl, rows=rows):
+                nextCursor += len(docs)
+                self.final_term_set_tagging(docs, final_term_set, updates)
+                self._logger.debug("final term set tagged for current batch. nextCursor[%s]" % str(nextCursor))
 
-                if FIELD_TERM_CANDIDATES in doc:
-                    term_candidates = doc[FIELD_TERM_CANDIDATES]
-                    filtered_candidates = [candidate for candidate in term_candidates if candidate in final_term_set]
+        self._logger.info("Industry Term extraction and indexing are completed!")
+
+    def final_term_set_tagging(self, docs, final_term_set, updates):
+        """
+        tag a page of documents with final term set and add atomic updates of industry term field into update buffer
 
-                    if self.index_dict_term_with_industry_term and FIELD_DICTIONARY_TERM in doc:
-                        dict_terms = doc[FIELD_DICTIONARY_TERM]
-                        if dict_terms:
-                            filtered_candidates.extend(dict_terms)
+        params:
+            final_term_set, set (or frozenset) of final terms
 
-                    # print("final industry_terms:", industry_terms)
-                    doc[FIELD_INDUSTRY_TERM] = list(set(filtered_candidates))
+        Tagging is a hashed set lookup per candidate and is bound by the scan and update requests of every page,
+        so it runs in current process.
+        """
+        for doc in docs:
 
-                    cur_docs_to_commits.append(doc)
-                else:
-                    doc[FIELD_INDUSTRY_TERM] = []
+            if FIELD_TERM_CANDIDATES in doc:
+                term_candidates = doc[FIELD_TERM_CANDIDATES]
+                filtered_candidates = [candidate for candidate in term_candidates if candidate in final_term_set]
 
-            self.solrClient.batch_update_documents(cur_docs_to_commits)
-            self._logger.debug("batch updated final term set for current batch. nextCursor[%s]" % str(nextCursor))
+                if self.index_dict_term_with_industry_term and FIELD_DICTIONARY_TERM in doc:
+                    dict_terms = doc[FIELD_DICTIONARY_TERM]
+                    if dict_terms:
+                        filtered_candidates.extend(dict_terms)
 
-        self._logger.info("Industry Term extraction and indexing are completed!")
+                # print("final industry_terms:", industry_terms)
+                updates.add(self.solrClient.atomic_update_document(doc[self.solrClient.field_doc_id],
+                                                                   {FIELD_INDUSTRY_TERM: list(set(filtered_candidates))}))
 
     def save_ranked_candidates_to_db(self, core_name, ranked_term_tuple_list):
         """
         save all ranked term candidates to sqllite db and export afterward for the sake of evaluation and cut-off threshold selection
         params:
             core_name,                solr core name
-            ranked_term_tuple_list,   ranked term tuple list (term, weight) 
+            ranked_term_tuple_list,   ranked term tuple list (term, weight), e.g., RankedCandidates read from
+                                      candidate store
         return string, database path
         """
 
@@ -246,14 +266,9 @@ class IndustryTermRecogniser(object):
             c.execute('''delete from term_candidates;''')
             c.commit()
 
-            for term, score in ranked_term_tuple_list:
-                try:
-                    c.execute('INSERT INTO term_candidates(term_name, weight) VALUES(?,?)', [term, score])
-
-                except sqlite3.IntegrityError:
-                    print("duplicated term! term is [%s]" % term);
-                except:
-                    print("SQL Insert Error", sys.exc_info()[0])
+            # duplicated terms are skipped
+            c.executemany('INSERT OR IGNORE INTO term_candidates(term_name, weight) VALUES(?,?)',
+                          iter(ranked_term_tuple_list))
             c.commit()
         except:
             print("SQL Insert Error", sys.exc_info()[0])
@@ -262,21 +277,33 @@ class IndustryTermRecogniser(object):
         self._logger.info("complete data loading into db.")
         return db_path
 
-    def export_ranked_terms_to_csv(self, term_db_path):
+    def export_ranked_terms_to_csv(self, term_db_path, ranked_term_tuple_list=None):
+        """
+        export ranked terms into '[term db name].csv'
+        params:
+            term_db_path, terminology database path (see save_ranked_candidates_to_db)
+            ranked_term_tuple_list, optional, ranked term tuple list (term, weight) to export instead of reading the
+                                    database, e.g., RankedCandidates read from candidate store
+        """
         self._logger.info("exporting [%s] into csv ...", term_db_path)
 
         dbname = path_leaf(term_db_path)
 
         output_csv = os.path.join(os.path.dirname(__file__), '..', dbname + ".csv")
 
-        query_term_set = '''select * from term_candidates;'''
-        conn_term_db = sqlite3.connect(term_db_path)
-        term_resultset = conn_term_db.execute(query_term_set)
-        with open(output_csv, 'w', encoding="utf-8") as outfile:
-            csvWriter = csv.writer(outfile, delimiter=",", lineterminator='\n', quoting=csv.QUOTE_MINIMAL)
-            csvWriter.writerow(['term', 'weight'])
-            for row in term_resultset:
-                csvWriter.writerow([row[0], row[1]])
+        conn_term_db = None
+        if ranked_term_tuple_list is None:
+            query_term_set = '''select * from term_candidates;'''
+            conn_term_db = sqlite3.connect(term_db_path)
+            ranked_term_tuple_list = conn_term_db.execute(query_term_set)
+        try:
+            with open(output_csv, 'w', encoding="utf-8") as outfile:
+                csvWriter = csv.writer(outfile, delimiter=",", lineterminator='\n', quoting=csv.QUOTE_MINIMAL)
+                csvWriter.writerow(['term', 'weight'])
+                csvWriter.writerows(ranked_term_tuple_list)
+        finally:
+            if conn_term_db is not None:
+                conn_term_db.close()
 
         self._logger.info("terms has been exported into [%s]", output_csv)
 
@@ -339,11 +366,153 @@ class IndustryTermRecogniser(object):
         raise NotImplementedError("Should have implemented this method!")
 
 
+# shared data loaded once per ranking worker process by pool initializer
+_ranking_worker_context = {}
+
+
+def init_ranking_worker(solr_core_url=None, subsumption_index=None, ttf_table=None):
+    """
+    ranking pool initializer
+
+    config is parsed and a SolrClient is created once per worker process and reused for every ranking task
+    """
+    import time
+    start = time.time()
+
+    _ranking_worker_context['subsumption_index'] = subsumption_index
+    _ranking_worker_context['ttf_table'] = ttf_table
+
+    config = configparser.ConfigParser()
+    config.read(os.path.join(os.path.dirname(__file__), '..', 'config', 'config'))
+    _ranking_worker_context['config'] = config
+    if solr_core_url is not None:
+        _ranking_worker_context['solr_client'] = SolrClient(solr_core_url, config=config)
+
+    logging.getLogger(__name__).debug("ranking worker [%s] is initialised in [%s] seconds.", os.getpid(),
+                                      time.time() - start)
+
+
+def get_worker_solr_client(solr_core_url):
+    """
+    return the SolrClient of current (ranking worker) process, which is created only once per process
+    """
+    solr_client = _ranking_worker_context.get('solr_client')
+    if solr_client is None or solr_client.solrURL != solr_core_url:
+        config = _ranking_worker_context.get('config')
+        solr_client = SolrClient(solr_core_url, config=config)
+        _ranking_worker_context['solr_client'] = solr_client
+    return solr_client
+
+
+def measure_ranking_task_overhead(solr_core_url, repeat=100):
+    """
+    measure per-task overhead of creating a SolrClient (config parsing included) in every ranking task,
+    compared with reusing the SolrClient of worker process
+
+    return dict, average seconds per task of 'per_task_client' and 'worker_client', and 'saved' seconds per task
+    """
+    import time
+    start = time.time()
+    for i in range(repeat):
+        SolrClient(solr_core_url)
+    per_task_client = (time.time() - start) / repeat
+
+    start = time.time()
+    for i in range(repeat):
+        get_worker_solr_client(solr_core_url)
+    worker_client = (time.time() - start) / repeat
+
+    return {'per_task_client': per_task_client, 'worker_client': worker_client,
+            'saved': per_task_client - worker_client}
+
+
+def candidate_tagging(tagging_processor, docs, field_doc_id, frequency_filtering=True):
+    """
+    term candidate tagging + dictionary tagging (optional) for a page of documents
+    params:
+        frequency_filtering, False to tag documents with candidates before frequency filtering
+    return list, tagged documents to update, with the document id and tagged fields only
+            (sent as atomic updates, see TermRanker.atomic_updates)
+    """
+    _logger = logging.getLogger(__name__)
+    tagged_docs = []
+    for doc in docs:
+        content = doc[FIELD_CONTENT]
+        doc_id = doc[field_doc_id]
+
+        if FIELD_TERM_CANDIDATES in doc and RE_TAGGING is False:
+            _logger.debug("current document [%s] has been processed and tagged with candidates! "
+                          "Skip for re-tagging ...", doc_id)
+            continue
+
+        # lang= doc['language_s']
+        # skip non-english ?
+        '''
+        if lang != 'en':
+            continue
+        '''
+        term_candidates = tagging_processor.term_candidate_extraction(content, frequency_filtering=frequency_filtering)
+        tagged_doc = {field_doc_id: doc_id, FIELD_TERM_CANDIDATES: list(term_candidates)}
+        tagged_docs.append(tagged_doc)
+
+    if tagging_processor.dict_tagging and tagged_docs:
+        # dictionary tagging of the whole page (see TaggingProcessor.batch_term_dictionary_tagging)
+        contents = dict((doc[field_doc_id], doc[FIELD_CONTENT]) for doc in docs)
+        dictionary_terms = tagging_processor.batch_term_dictionary_tagging(
+            [(tagged_doc[field_doc_id], contents[tagged_doc[field_doc_id]]) for tagged_doc in tagged_docs])
+        for tagged_doc in tagged_docs:
+            tagged_doc[FIELD_DICTIONARY_TERM] = list(dictionary_terms[tagged_doc[field_doc_id]])
+
+    tagging_processor.flush_caches()
+    return tagged_docs
+
+
+# TaggingProcessor created once per tagging worker process by pool initializer
+_tagging_worker_context = {}
+
+
+def init_tagging_worker():
+    """
+    tagging pool initializer
+
+    config is parsed and a TaggingProcessor (stopwords, grammars, dictionary and SolrClient) is loaded once per worker
+    process and kept warm for every page of documents
+    """
+    import time
+    start = time.time()
+
+    config = configparser.ConfigParser()
+    config.read(os.path.join(os.path.dirname(__file__), '..', 'config', 'config'))
+    tagging_processor = TaggingProcessor(config=config)
+    # pages are already tagged in parallel by tagging workers, fuzzy dictionary matching runs in worker process
+    tagging_processor.dict_tagging_workers = 1
+    _tagging_worker_context['tagging_processor'] = tagging_processor
+
+    logging.getLogger(__name__).debug("tagging worker [%s] is initialised in [%s] seconds.", os.getpid(),
+                                      time.time() - start)
+
+
+def tagging_worker_task(docs, field_doc_id, frequency_filtering=True):
+    """
+    tag a page of documents with the TaggingProcessor of current (tagging worker) process
+    return list, tagged documents to update
+    """
+    tagging_processor = _tagging_worker_context.get('tagging_processor')
+    if tagging_processor is None:
+        init_tagging_worker()
+        tagging_processor = _tagging_worker_context['tagging_processor']
+    return candidate_tagging(tagging_processor, docs, field_doc_id, frequency_filtering=frequency_filtering)
+
+
 def term_weight_async_calculation(solrURL, term, optional_params=dict()):
     rankingMethod = optional_params['rankingMethod']
     if rankingMethod == "cValue":
-        all_candidates = optional_params['all_candidates']
-        return CValueRanker.calculate(term, all_candidates, solrURL)
+        all_candidates = optional_params.get('all_candidates')
+        subsumption_index = optional_params.get('subsumption_index',
+                                                _ranking_worker_context.get('subsumption_index'))
+        ttf_table = optional_params.get('ttf_table', _ranking_worker_context.get('ttf_table'))
+        return CValueRanker.calculate(term, all_candidates, solrURL, subsumption_index=subsumption_index,
+                                      ttf_table=ttf_table)
     else:
         raise Exception("Ranking Method is not supported!")
 
@@ -361,6 +530,7 @@ class TermRanker(object):
             self._logger.exception(excMsg)
             raise Exception(excMsg)
 
+        self.config = config
         self.taggingProcessor = TaggingProcessor(config=config)
 
         self.solrClient = solr_client
@@ -379,6 +549,23 @@ class TermRanker(object):
                 "Oops! 'solr_field_doc_id' is not found in config file. Default to 'id' field instead.")
             self.field_doc_id = 'id'
 
+        try:
+            self.parallel_tagging = config.getboolean('DEFAULT', 'parallel_tagging')
+        except (KeyError, configparser.NoOptionError):
+            self.parallel_tagging = False
+
+        try:
+            self.parallel_tagging_window = int(config['DEFAULT']['parallel_tagging_window'])
+        except KeyError:
+            self.parallel_tagging_window = 2 * int(self.parallel_workers)
+
+        try:
+            self.candidate_store_dir = config['DEFAULT']['candidate_store_dir']
+        except KeyError:
+            self.candidate_store_dir = os.path.join(os.path.dirname(__file__), '..',
+                                                    self.solrClient.solr_core + "_candidate_store")
+        self.candidate_store = None
+
     def batch_candidate_tagging(self):
         """
         batch term candidate tagging + dictionary tagging (optional)
@@ -387,59 +574,202 @@ class TermRanker(object):
 
         self._logger.info("total document size for candidate term tagging [%s]" % totalDocSize)
 
-        rows = 10
+        rows = self.solrClient.scan_page_size
         self._logger.info("starting candidate term tagging in batch size [%s]" % rows)
 
-        for nextCursor in range(0, totalDocSize, rows):
-            result = self.solrClient.load_documents(nextCursor, rows)
-            docs = result['docs']
+        try:
+            if self.taggingProcessor.frequency_filtering_mode == 'corpus':
+                self.corpus_filtered_candidate_tagging(rows)
+            else:
+                with self.solrClient.update_buffer() as updates:
+                    for tagged_docs in self.tagged_pages(rows):
+                        updates.add_all(self.atomic_updates(tagged_docs))
+        finally:
+            self.taggingProcessor.close_dictionary_tagging_pool()
 
-            # TODO: parallel annotation
-            cur_docs_to_commits = []
-            for doc in docs:
-                content = doc[FIELD_CONTENT]
-                doc_id = doc[self.field_doc_id]
+        self._logger.info("Term candidate extraction and loading for whole index is completed!")
 
-                if FIELD_TERM_CANDIDATES in doc and RE_TAGGING is False:
-                    self._logger.debug("current document [%s] has been processed and tagged with candidates! "
-                                       "Skip for re-tagging ...", doc_id)
-                    continue
+    def atomic_updates(self, tagged_docs):
+        """
+        return generator, atomic updates which set the tagged fields of every document
+        """
+        for tagged_doc in tagged_docs:
+            doc_id = tagged_doc.pop(self.field_doc_id)
+            yield self.solrClient.atomic_update_document(doc_id, tagged_doc)
 
-                # lang= doc['language_s']
-                # skip non-english ?
-                '''
-                if lang != 'en':
-                    continue
-                '''
-                term_candidates = self.taggingProcessor.term_candidate_extraction(content)
-                doc[FIELD_TERM_CANDIDATES] = list(term_candidates)
+    def scan_untagged_document_pages(self, rows):
+        """
+        scan the id and content of the documents to be tagged (i.e., all the documents if RE_TAGGING is set, otherwise
+        the documents not tagged with candidates yet)
+        return generator of document pages
+        """
+        query_condition = '*:*' if RE_TAGGING else '*:* -%s:[* TO *]' % FIELD_TERM_CANDIDATES
+        fl = [self.field_doc_id, FIELD_CONTENT, FIELD_TERM_CANDIDATES]
+        return self.solrClient.scan_document_pages(query_condition=query_condition, fl=fl, rows=rows)
 
-                if self.taggingProcessor.dict_tagging:
-                    dictionary_terms = self.taggingProcessor.term_dictionary_tagging(doc_id)
-                    doc[FIELD_DICTIONARY_TERM] = list(dictionary_terms)
+    def tagged_pages(self, rows, frequency_filtering=True):
+        """
+        scan the whole index and tag every page of documents, either serially or by parallel tagging workers
+        return generator of tagged document pages
+        """
+        if self.parallel_tagging and int(self.parallel_workers) > 1:
+            for tagged_docs in self.parallel_tagged_pages(rows, frequency_filtering):
+                yield tagged_docs
+            return
 
-                cur_docs_to_commits.append(doc)
+        nextCursor = 0
+        for docs in self.scan_untagged_document_pages(rows):
+            nextCursor += len(docs)
+            yield candidate_tagging(self.taggingProcessor, docs, self.field_doc_id,
+                                    frequency_filtering=frequency_filtering)
+            self._logger.debug("current batch of candidate tagging is done. nextCursor[%s]" % str(nextCursor))
 
-            self.solrClient.batch_update_documents(cur_docs_to_commits)
-            self._logger.debug("batch updated current batch of candidata tagging. nextCursor[%s]" % str(nextCursor))
+    def parallel_tagged_pages(self, rows, frequency_filtering=True):
+        """
+        pipelined candidate tagging:
+            fetch stage (current process) scans pages of documents and submits them to a pool of tagging workers,
+            every worker tags the pages with its own warm TaggingProcessor (see init_tagging_worker),
+            write stage (consumer of this generator) receives tagged pages in order.
 
-        self._logger.info("Term candidate extraction and loading for whole index is completed!")
+        At most 'parallel_tagging_window' pages are in flight, which keeps memory flat regardless of index size.
+        return generator of tagged document pages
+        """
+        from collections import deque
+
+        window = self.parallel_tagging_window
+        self._logger.info("parallel candidate tagging with [%s] workers and [%s] pages in flight",
+                          self.parallel_workers, window)
+
+        with MultiprocPool(processes=int(self.parallel_workers), initializer=init_tagging_worker) as pool:
+            in_flight = deque()
+            nextCursor = 0
+            for docs in self.scan_untagged_document_pages(rows):
+                nextCursor += len(docs)
+                in_flight.append(pool.apply_async(tagging_worker_task, (docs, self.field_doc_id, frequency_filtering)))
+                if len(in_flight) >= window:
+                    yield in_flight.popleft().get()
+                self._logger.debug("current batch of candidate tagging is submitted. nextCursor[%s]" % str(nextCursor))
+
+            while in_flight:
+                yield in_flight.popleft().get()
+
+            # workers exit gracefully and flush their caches (see cache_store)
+            pool.close()
+            pool.join()
+
+    def corpus_filtered_candidate_tagging(self, rows):
+        """
+        candidate tagging with frequency filtering over the whole candidate vocabulary ('frequency_filtering_mode=corpus'):
+            1) documents are tagged with candidates before frequency filtering and spilled to a temporary file, while
+                the deduplicated candidate vocabulary is collected;
+            2) ttf of the vocabulary is requested once in bulk (see SolrClient.bulk_totaltermfreq);
+            3) candidates of every spilled document are filtered by the ttf table and documents are updated.
 
-    def get_all_candidates(self):
+        Solr ttf requests scale with vocabulary size instead of total candidate occurrences.
+        """
+        import json
+        import tempfile
+
+        vocabulary = set()
+        with tempfile.TemporaryFile(mode='w+', encoding='utf-8') as spill_file:
+            num_docs = 0
+            for tagged_docs in self.tagged_pages(rows, frequency_filtering=False):
+                for doc in tagged_docs:
+                    vocabulary.update(doc[FIELD_TERM_CANDIDATES])
+                    spill_file.write(json.dumps(doc, ensure_ascii=False))
+                    spill_file.write('\n')
+                num_docs += len(tagged_docs)
+
+            self._logger.info("[%s] documents are tagged with [%s] distinct candidates before frequency filtering",
+                              num_docs, len(vocabulary))
+
+            ttf_tables = self.solrClient.bulk_totaltermfreq(self.taggingProcessor.solr_field_content, vocabulary)
+            self._logger.info("ttf of candidate vocabulary is loaded. Filtering candidates of every document ...")
+
+            spill_file.seek(0)
+            with self.solrClient.update_buffer() as updates:
+                for line in spill_file:
+                    tagged_doc = json.loads(line)
+                    tagged_doc[FIELD_TERM_CANDIDATES] = list(self.taggingProcessor.frequency_filtering(
+                        set(tagged_doc[FIELD_TERM_CANDIDATES]), ttf_tables=ttf_tables))
+                    updates.add_all(self.atomic_updates([tagged_doc]))
+
+    def open_candidate_store(self):
+        """
+        return CandidateStore of 'candidate_store_dir'
+        """
+        if self.candidate_store is None:
+            self.candidate_store = CandidateStore(self.candidate_store_dir)
+        return self.candidate_store
+
+    def get_index_version(self):
+        """
+        return version of the Solr index (see SolrClient.index_version), or None if it cannot be requested
+        """
+        try:
+            return self.solrClient.index_version()
+        except (SolrError, KeyError):
+            self._logger.warning("index version cannot be requested from Luke request handler. "
+                                 "Candidate store will not be reused.")
+            return None
+
+    def export_all_candidates(self, index_version=None):
         """
         query all indexed terms from FIELD_TERM_CANDIDATES
+
+        Terms are read from the terms component page by page (see SolrClient.scan_field_terms) and spilled into
+        the candidate vocabulary of the candidate store ('candidate_store_dir'), which is memory mapped instead of
+        held in a dict. Previous candidates and their statistics in the store are replaced.
+        params:
+            index_version, optional, current version of the Solr index (see get_index_version) recorded in the store
+        return VocabularyStore, read-only mapping of candidate -> df
+        """
+        candidates = self.open_candidate_store().write_candidates(
+            self.solrClient.scan_field_terms(FIELD_TERM_CANDIDATES), index_version=index_version)
+        self._logger.info("[%s] candidates of index version [%s] are exported into candidate store [%s]",
+                          len(candidates), index_version, self.candidate_store_dir)
+        return candidates
+
+    def get_all_candidates(self):
         """
-        all_candidates = self.solrClient.field_terms(FIELD_TERM_CANDIDATES)
-        return all_candidates
+        all candidates of the candidate store, which are exported from Solr (see export_all_candidates) unless the
+        store is exported from the current version of the index (i.e., no commit since the export)
+        return VocabularyStore, read-only mapping of candidate -> df
+        """
+        candidate_store = self.open_candidate_store()
+        index_version = self.get_index_version()
+        if index_version is None or not candidate_store.has_candidates(index_version):
+            return self.export_all_candidates(index_version)
+        self._logger.debug("reuse candidates of index version [%s] in candidate store [%s]", index_version,
+                           self.candidate_store_dir)
+        return candidate_store.candidates
 
     def get_all_candidates_N(self):
         """
-        N is the total number of candidates appeared in the corpus
+        N is the total number of candidates appeared in the corpus, i.e., sum of ttf of all candidates (every
+        normalised form counted once) read from the statistics columns of the candidate store, which are loaded
+        again if the index has changed (see get_all_candidates)
         """
         self._logger.debug("get_all_candidates Num...")
-        candidates = self.get_all_candidates()
-        self._logger.debug("all candidates(surface form) number: [%s]", len(candidates))
-        return TermRanker.sum_ttf_candidates(self.solrClient, list(candidates.keys()))
+        candidate_store = self.open_candidate_store()
+        self.get_all_candidates()
+        if not candidate_store.has_term_statistics():
+            self.load_candidate_statistics()
+        self._logger.debug("all candidates(surface form) number: [%s]", len(candidate_store))
+        return candidate_store.total_ttf()
+
+    def load_candidate_statistics(self):
+        """
+        fetch total term frequency of all the candidates (see get_all_candidates) batch by batch (see
+        SolrClient.scan_totaltermfreq) and write normalised forms, ttf, token counts and subsumption index postings
+        into the candidate store
+        return CandidateStore, used as ttf table and subsumption index of ranking
+        """
+        candidate_store = self.open_candidate_store()
+        candidate_store.write_term_statistics(
+            self.solrClient.get_ttf_normalised_term,
+            lambda normed_terms: self.solrClient.scan_totaltermfreq(FIELD_CONTENT, normed_terms))
+        return candidate_store
 
     @staticmethod
     def sum_ttf_candidates(solrClient, candidates_list):
@@ -465,6 +795,14 @@ class CValueRanker(TermRanker):
         self._logger = logging.getLogger(__name__)
         self._logger.info(self.__class__.__name__)
 
+        try:
+            self.cvalue_engine = self.config['DEFAULT']['cvalue_engine'].lower()
+            if self.cvalue_engine not in ('vectorised', 'parallel'):
+                raise Exception("current setting [%s] for 'cvalue_engine' is not supported!" % self.cvalue_engine)
+        except KeyError:
+            self._logger.exception("Oops! 'cvalue_engine' is not found in config file. Default to 'parallel'.")
+            self.cvalue_engine = 'parallel'
+
     def process(self, tagging=True):
         """
         load term candidates-> c-value based ranking
@@ -477,7 +815,7 @@ class CValueRanker(TermRanker):
         return ranked_term_tuple_list
 
     @staticmethod
-    def get_longer_terms(term, all_candidates):
+    def get_longer_terms(term, all_candidates, subsumption_index=None):
         """
         the number of candidate terms that contain current term
         
@@ -485,10 +823,14 @@ class CValueRanker(TermRanker):
         params:
             term, current term surface form
             all candidates: all candidates surface form from index
+            subsumption_index, optional, SubsumptionIndex of all candidates to avoid scanning all candidates
         return longer term list
         """
         _logger = logging.getLogger(__name__)
         try:
+            if subsumption_index is not None:
+                return subsumption_index.longer_terms(term)
+
             return [longer_term for longer_term in all_candidates
                     if term != longer_term and TermUtil.normalise(term) != TermUtil.normalise(longer_term) and
                     set(TermUtil.normalise(term).split(' ')).issubset(set(TermUtil.normalise(longer_term).split(' ')))]
@@ -507,7 +849,7 @@ class CValueRanker(TermRanker):
         self._logger.info("term candidate c-value ranking...")
 
         self._logger.info("loading all candidates ...")
-        all_candidates = super().get_all_candidates()
+        all_candidates = super().export_all_candidates(self.get_index_version())
 
         if all_candidates is None or len(all_candidates) == 0:
             self._logger.info("No candidate found. Skip ranking.");
@@ -515,34 +857,83 @@ class CValueRanker(TermRanker):
 
         self._logger.info("all candidates is loaded. Total [%s] candidates to rank...", len(all_candidates))
 
-        self._logger.info(" compute c-values for all candidates with [%s] parallel workers ...", self.parallel_workers)
-
-        with MultiprocPool(processes=int(self.parallel_workers)) as pool:
-            optional_parameter = {'rankingMethod': 'cValue', 'all_candidates': all_candidates}
-            ranked_all_candidates = pool.starmap(term_weight_async_calculation,
-                                                 [(self.solrClient.solrURL, candidate, optional_parameter) for candidate
-                                                  in all_candidates])
+        self._logger.info("loading total term frequencies and building subsumption index of all candidates ...")
+        candidate_store = self.load_candidate_statistics()
+        subsumption_index = SubsumptionIndex(candidate_store)
+        self._logger.info("total term frequencies of [%s] normalised terms are loaded. "
+                          "subsumption index is built with [%s] normalised tokens.",
+                          len(candidate_store.normed_terms), len(candidate_store.tokens))
+
+        cvalues = None
+        if self.cvalue_engine == 'vectorised':
+            try:
+                cvalues = self.vectorised_calculation(subsumption_index, candidate_store)
+            except ImportError:
+                self._logger.exception("NumPy and SciPy are required by vectorised c-value engine. "
+                                       "Fall back to parallel c-value computation.")
+
+        if cvalues is None:
+            cvalues = [term_cvalue_tuple[1] for term_cvalue_tuple in
+                       self.parallel_calculation(all_candidates, subsumption_index, candidate_store)]
 
         self._logger.info(" all candidates c-value computation is completed.")
 
         self._logger.info(" all candidates c-value ranking...")
-        ranked_all_candidates = {term_cvalue_tuple[0]: term_cvalue_tuple[1] for term_cvalue_tuple in
-                                 ranked_all_candidates}
-
-        import operator
-        ranked_all_candidates = sorted(ranked_all_candidates.items(), key=operator.itemgetter(1), reverse=True)
+        candidate_store.write_cvalues(cvalues)
+        ranked_all_candidates = candidate_store.ranked_candidates()
 
         self._logger.info("final term size [%s] after c-value ranking. ", str(len(ranked_all_candidates)))
         return ranked_all_candidates
 
-    @staticmethod
-    def calculate(term, all_candidates, solr_core_url):
-        solrClient = SolrClient(solr_core_url)
+    def parallel_calculation(self, all_candidates, subsumption_index, ttf_table):
+        """
+        compute c-value of every candidate in a pool of parallel workers
+        params:
+            ttf_table, CandidateStore of all candidates
+        return tuple list: (term, c-value) in order of all_candidates
+        """
+        self._logger.info(" compute c-values for all candidates with [%s] parallel workers ...", self.parallel_workers)
+
+        # the index and ttf table are shipped once to every worker instead of pickling all candidates into every task.
+        # Both read the CandidateStore, which is shipped as its run directory and memory mapped by every worker.
+        with MultiprocPool(processes=int(self.parallel_workers), initializer=init_ranking_worker,
+                           initargs=(self.solrClient.solrURL, subsumption_index, ttf_table)) as pool:
+            optional_parameter = {'rankingMethod': 'cValue'}
+            results = pool.starmap(term_weight_async_calculation,
+                                   [(self.solrClient.solrURL, candidate, optional_parameter) for candidate
+                                    in all_candidates])
+
+            # workers exit gracefully and flush their caches (see cache_store)
+            pool.close()
+            pool.join()
+            return results
+
+    def vectorised_calculation(self, subsumption_index, candidate_store):
+        """
+        compute c-value of all candidates in one vectorised pass (see cvalue_engine) over the columns of the
+        candidate store
+        return float array: c-value of every candidate in candidate id order
+        """
+        from cvalue_engine import build_store_cvalue_inputs, batch_cvalue
 
-        longer_terms = CValueRanker.get_longer_terms(term, all_candidates)
-        term_freq_dict, normed_term_dict = solrClient.totaltermfreq(FIELD_CONTENT, {term})
+        self._logger.info(" compute c-values for all candidates with vectorised c-value engine ...")
+        term_lengths, term_freqs, nested_matrix, nested_freqs, longer_term_counts = \
+            build_store_cvalue_inputs(subsumption_index, candidate_store)
+        self._logger.debug(" is-nested-in matrix [%s x %s] with [%s] nested relations is built.",
+                           nested_matrix.shape[0], nested_matrix.shape[1], nested_matrix.nnz)
 
-        term_freq = list(term_freq_dict.values())[0]
+        return batch_cvalue(term_lengths, term_freqs, nested_matrix, nested_freqs, longer_term_counts)
+
+    @staticmethod
+    def calculate(term, all_candidates, solr_core_url, subsumption_index=None, ttf_table=None):
+        solrClient = None if ttf_table is not None and term in ttf_table else get_worker_solr_client(solr_core_url)
+
+        longer_terms = CValueRanker.get_longer_terms(term, all_candidates, subsumption_index)
+        if solrClient is None:
+            term_freq = ttf_table.ttf(term)
+        else:
+            term_freq_dict, normed_term_dict = solrClient.totaltermfreq(FIELD_CONTENT, {term})
+            term_freq = list(term_freq_dict.values())[0]
 
         # print("term freq of '",term,"': ", term_freq)
 
@@ -555,7 +946,10 @@ class CValueRanker(TermRanker):
         if longer_terms:
             p_ta = len(longer_terms)
             # print("p_ta:", p_ta)
-            sum_fb = TermRanker.sum_ttf_candidates(solrClient, longer_terms)
+            if solrClient is None:
+                sum_fb = ttf_table.sum_ttf(longer_terms)
+            else:
+                sum_fb = TermRanker.sum_ttf_candidates(solrClient, longer_terms)
             # print("sum_fb:", sum_fb)
             term_cValue = log2a * (term_freq - (1 / p_ta) * sum_fb)
         else:
@@ -674,12 +1068,17 @@ def test_cvalue_calcuation():
     print("cvalue 'confirmation' :", term_cvalue)
 
 
+def test_ranking_task_overhead():
+    overhead = measure_ranking_task_overhead("http://localhost:8983/solr/tatasteel")
+    print("ranking task overhead (seconds per task): ", overhead)
+
+
 def test_cvalue_ranking():
     solrClient = SolrClient("http://localhost:8983/solr/tatasteel")
     cvalueAlg = CValueRanker(solrClient)
     ranked_terms = cvalueAlg.ranking()
 
-    print(ranked_terms)
+    print(list(ranked_terms))
 
 
 def test_tr_tagging():
@@ -15,6 +15,28 @@ from nltk.tokenize import word_tokenize
 import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
+import time
+
+# POS tagger instance cached per process (i.e., shared by all the LinguisticPreprocessor of a pool worker)
+_process_pos_taggers = {}
+
+
+def get_process_pos_tagger():
+    """
+    return NLTK's currently recommended POS tagger (as used by nltk.pos_tag) loaded once per process
+    """
+    tagger = _process_pos_taggers.get(os.getpid())
+    if tagger is None:
+        try:
+            from nltk.tag import PerceptronTagger
+            tagger = PerceptronTagger()
+        except ImportError:
+            # NLTK 3.0 default tagger
+            import nltk
+            tagger = nltk.data.load(nltk.tag._POS_TAGGER)
+        _process_pos_taggers[os.getpid()] = tagger
+    return tagger
+
 
 class LinguisticPreprocessor(object):
 
@@ -42,21 +64,37 @@ class LinguisticPreprocessor(object):
         customised tokeniser for irregular text + NLTK pos tagging
         return normalised pos tagging in tuple list 
         """
+        return self.batch_customised_preprocessing([sent_content])[0]
+    
+    def batch_customised_preprocessing(self, sentences):
+        """
+        customised tokeniser for irregular text + NLTK pos tagging of a batch of sentences (e.g., all the sentences of
+        a document or of a page of documents) in one call of the per-process tagger
+        return list, normalised pos tagging in tuple list of every sentence (aligned with the given sentences)
+        """
         if self.text_tokeniser is None:
             self.text_tokeniser = self.get_special_text_tokeniser()
         if self.pos_tagging is None:
-            self.pos_tagging = self.nltk_pos_tag()
+            self.pos_tagging = get_process_pos_tagger()
 
-        pos_tags=self.pos_tagging(self.text_tokeniser.tokenize(sent_content))
+        start = time.time()
+        tokenised_sentences = [self.text_tokeniser.tokenize(sent_content) for sent_content in sentences]
+        batch_pos_tags = self.pos_tagging.tag_sents(tokenised_sentences)
 
         # pos_tags=self.pos_tagging(word_tokenize(sent_content))
 
         try:
-            return tuple(map(lambda x: (x[0], x[0]) if x[0]=='(' or x[0]==')' or x[0] == '@' or x[0] == '\\' or x[0] == '/' else (x[0], x[1]), pos_tags))
+            batch_pos_tags = [tuple(map(lambda x: (x[0], x[0]) if x[0]=='(' or x[0]==')' or x[0] == '@' or x[0] == '\\' or x[0] == '/' else (x[0], x[1]), pos_tags)) for pos_tags in batch_pos_tags]
         except AttributeError:
             self._logger.error("Bug in current NLTK version. Please install NLTK 3.0.")
             raise AttributeError
         
+        elapsed = time.time() - start
+        num_tokens = sum(len(pos_tags) for pos_tags in batch_pos_tags)
+        self._logger.debug("POS tagged [%s] sentences ([%s] tokens) in [%.3f] seconds, [%.1f] tokens/s", len(sentences),
+                           num_tokens, elapsed, (num_tokens / elapsed) if elapsed > 0 else 0.0)
+        return batch_pos_tags
+        
     def get_perceptron_tagger(self):
         """
         Perform preprocessing (shallow parsing) by state-of-the-art PerceptronTagger (98.8% accuracy)
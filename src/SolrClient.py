@@ -16,16 +16,19 @@ from urllib.parse import urlencode
 from urllib.parse import urljoin, urlsplit
 import json
 import re
+import random
+import itertools
 
 import requests
 import requests.exceptions
 from requests.adapters import HTTPAdapter
 
+from requests.packages.urllib3.util.retry import Retry
+
 from httplib2 import Credentials
 
-s = requests.Session()
-s.mount('http://', HTTPAdapter(max_retries=10))
-s.mount('https://', HTTPAdapter(max_retries=10))
+from named_list import iter_named_list, named_list_names, named_list_to_dict, decode_named_list, iter_terms_xml
+
 # sleep for every field analysis request to avoid "Max retries exceeded with url"
 sleep_seconds_before_field_analysis_request = 0.1
 from time import sleep
@@ -34,6 +37,13 @@ from httplib2 import Http
 DATETIME_REGEX = re.compile('^(?P<year>\d{4})-(?P<month>\d{2})-(?P<day>\d{2})T(?P<hour>\d{2}):(?P<minute>\d{2}):(?P<second>\d{2})(\.\d+)?Z$')
 ER_RE = re.compile ('<pre>(.|\n)*?</pre>')
 
+# form encoded request body for long queries sent as POST
+FORM_HEADERS = {"Content-type": "application/x-www-form-urlencoded; charset=UTF-8"}
+
+# /tvrh parameters to return the terms of term vectors only (without tf, df, tf-idf, positions and offsets)
+TERMS_ONLY_TV_OPTIONS = {'tv': 'true', 'tv.all': 'false', 'tv.tf': 'false', 'tv.df': 'false', 'tv.tf_idf': 'false',
+                         'tv.positions': 'false', 'tv.offsets': 'false'}
+
 
 class Results(object):
     def __init__(self, response=None,decoder=None):
@@ -114,7 +124,7 @@ class TermVectorResult(object):
         if 'termVectors' in result:
             tv = result['termVectors']
             
-            self.tv = nested_list2dict(tv)
+            self.tv = decode_named_list(tv)
                         
         self.docs = result['response']['docs']
     
@@ -123,7 +133,124 @@ class TermVectorResult(object):
 
     def __iter__(self):
         return iter(self.docs)
-    
+
+
+class PooledHttpTransport(object):
+    """
+    Keep-alive HTTP transport shared by every SolrClient in a process.
+
+    One requests.Session is created per process (sessions must not be shared across fork) and mounted with
+    a pooled HTTPAdapter, so that repeated /select, /analysis/field and /tvrh requests reuse open TCP connections
+    instead of opening a new connection per request.
+
+    The pool and retry policy can be configured in the [SOLR_CLIENT] section of config file:
+        http_pool_connections, number of per-host connection pools to cache
+        http_pool_maxsize, maximum number of connections kept alive per host
+        http_pool_block, whether to block (rather than open a throwaway connection) when a host pool is exhausted
+        http_max_retries, maximum number of retries for connection errors and retryable status
+        http_retry_backoff_factor, backoff factor (in seconds) between retries
+        http_retry_status_forcelist, comma separated HTTP status codes to retry on
+    """
+    _instances = {}
+
+    def __init__(self, pool_connections=10, pool_maxsize=10, pool_block=False, max_retries=3,
+                 backoff_factor=0.2, status_forcelist=(500, 502, 503, 504)):
+        self._logger = logging.getLogger(__name__)
+
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+        self.pool_block = pool_block
+
+        self.retry_policy = Retry(total=max_retries, connect=max_retries, read=max_retries,
+                                  backoff_factor=backoff_factor, status_forcelist=status_forcelist,
+                                  raise_on_status=False)
+
+        self.adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize,
+                                   max_retries=self.retry_policy, pool_block=pool_block)
+        self.session = requests.Session()
+        self.session.mount('http://', self.adapter)
+        self.session.mount('https://', self.adapter)
+
+        self._request_count = 0
+        self._error_count = 0
+
+    @classmethod
+    def get_instance(cls, config=None):
+        """
+        return the transport of current process, created from the [SOLR_CLIENT] config section on first use
+        """
+        pid = os.getpid()
+        transport = cls._instances.get(pid)
+        if transport is None:
+            # forked workers inherit the parent's registry and must not reuse its sockets
+            cls._instances.clear()
+            transport = cls(**cls.load_transport_setting(config))
+            cls._instances[pid] = transport
+        return transport
+
+    @staticmethod
+    def load_transport_setting(config=None):
+        """
+        load pool size, per-host limit and retry/backoff policy from config
+        return dict, keyword arguments for PooledHttpTransport
+        """
+        _logger = logging.getLogger(__name__)
+        settings = {}
+        if config is None or not config.has_section('SOLR_CLIENT'):
+            return settings
+
+        section = config['SOLR_CLIENT']
+        try:
+            settings['pool_connections'] = int(section.get('http_pool_connections', 10))
+            settings['pool_maxsize'] = int(section.get('http_pool_maxsize', 10))
+            settings['pool_block'] = section.getboolean('http_pool_block', False)
+            settings['max_retries'] = int(section.get('http_max_retries', 3))
+            settings['backoff_factor'] = float(section.get('http_retry_backoff_factor', 0.2))
+            status_forcelist = section.get('http_retry_status_forcelist', '500,502,503,504')
+            settings['status_forcelist'] = tuple(int(status) for status in status_forcelist.split(',') if status.strip())
+        except ValueError:
+            _logger.exception("Oops! HTTP transport setting in [SOLR_CLIENT] is set incorrectly. "
+                              "Default pool and retry policy are used instead.")
+            settings = {}
+        return settings
+
+    def request(self, method, url, **kwargs):
+        self._request_count += 1
+        try:
+            return self.session.request(method=method, url=url, **kwargs)
+        except requests.exceptions.RequestException:
+            self._error_count += 1
+            raise
+
+    def stats(self):
+        """
+        connection reuse counters of current process
+
+        return dict, 'requests' sent by the transport, 'connections' opened,
+                'reused' requests served by a kept-alive connection, 'errors' and the 'reuse_ratio'
+        """
+        num_connections = 0
+        num_pool_requests = 0
+        pools = self.adapter.poolmanager.pools
+        for pool_key in pools.keys():
+            pool = pools.get(pool_key)
+            if pool is None:
+                continue
+            num_connections += pool.num_connections
+            num_pool_requests += pool.num_requests
+
+        reused = max(num_pool_requests - num_connections, 0)
+        return {'requests': self._request_count,
+                'connections': num_connections,
+                'reused': reused,
+                'errors': self._error_count,
+                'reuse_ratio': (reused / num_pool_requests) if num_pool_requests else 0.0}
+
+    def close(self):
+        self.session.close()
+        PooledHttpTransport._instances.pop(os.getpid(), None)
+
+
 class SolrClient(object):
     """
     Solr client APIs
@@ -131,7 +258,10 @@ class SolrClient(object):
 
     solrURL="http://localhost:8983/solr/tatasteel"
     
-    def __init__(self, server_url, decoder=None, timeout=60,result_class=Results,use_cache=None,cache=None,username=None,password=None):
+    def __init__(self, server_url, decoder=None, timeout=60,result_class=Results,use_cache=None,cache=None,username=None,password=None,config=None):
+        """
+        config, optional, parsed 'config' setting (configparser.ConfigParser). The config file is read when not given.
+        """
         self._logger=logging.getLogger(__name__)
 
         self.decoder = decoder or json.JSONDecoder()        
@@ -152,10 +282,10 @@ class SolrClient(object):
         self.timeout=timeout
         self.result_class = result_class
         
-        if use_cache:
-            self.http = Http(cache=cache or ".cache",timeout=self.timeout)
-        else:
-            self.http = Http(timeout=self.timeout)
+        # httplib2 client is created on first use
+        self._use_cache = use_cache
+        self._cache = cache
+        self._http = None
 
         self._auth = None
         if username != None and password is not None:
@@ -163,15 +293,165 @@ class SolrClient(object):
             self._auth=(username,password)
 
 
-        import configparser
-        config = configparser.ConfigParser()
-        config.read(os.path.join(os.path.dirname(__file__), '..', 'config','config'))
+        if config is None:
+            import configparser
+            config = configparser.ConfigParser()
+            config.read(os.path.join(os.path.dirname(__file__), '..', 'config','config'))
         try:
             self.solr_term_normaliser = config['DEFAULT']['solr_term_normaliser']
         except KeyError:
             self._logger.exception("Oops! 'solr_term_normaliser' is not found in config file. Default the analyser as 'industry_term_query_type'")
             self.solr_term_normaliser = "industry_term_query_type"
-        
+
+        self.load_term_normaliser_setting(config)
+
+        # no read timeout by default: exports of all terms, large ttf batches and commits can take long on a large core
+        try:
+            self.http_timeout = float(config['SOLR_CLIENT']['http_timeout'])
+        except KeyError:
+            self.http_timeout = None
+
+        try:
+            self.ttf_batch_size = int(config['SOLR_CLIENT']['ttf_batch_size'])
+        except KeyError:
+            self.ttf_batch_size = 500
+
+        try:
+            self.scan_page_size = int(config['SOLR_CLIENT']['scan_page_size'])
+        except KeyError:
+            self.scan_page_size = 100
+
+        try:
+            self.term_vector_batch_size = int(config['SOLR_CLIENT']['term_vector_batch_size'])
+        except KeyError:
+            self.term_vector_batch_size = 100
+
+        try:
+            self.terms_page_size = int(config['SOLR_CLIENT']['terms_page_size'])
+        except KeyError:
+            self.terms_page_size = 10000
+
+        try:
+            self.field_doc_id = config['DEFAULT']['solr_field_doc_id']
+        except KeyError:
+            self.field_doc_id = 'id'
+
+        self.load_update_setting(config)
+
+        self.transport = PooledHttpTransport.get_instance(config)
+
+    def load_update_setting(self, config):
+        """
+        batch size and commit policy of buffered updates (see SolrClient.update_buffer)
+        """
+        try:
+            self.update_batch_size = int(config['SOLR_CLIENT']['update_batch_size'])
+        except KeyError:
+            self.update_batch_size = 1000
+
+        try:
+            self.update_commit_policy = config['SOLR_CLIENT']['update_commit_policy']
+            if self.update_commit_policy not in SolrUpdateBuffer.COMMIT_POLICIES:
+                raise Exception("current setting [%s] for 'update_commit_policy' is not supported!" % self.update_commit_policy)
+        except KeyError:
+            self.update_commit_policy = 'phase'
+
+        try:
+            self.update_commit_within = int(config['SOLR_CLIENT']['update_commit_within'])
+        except KeyError:
+            self.update_commit_within = 60000
+
+    def load_term_normaliser_setting(self, config):
+        """
+        term normalisation is performed either by remote Solr field analysis ('solr'),
+        by the in-process replica of 'solr_term_normaliser' ('local'),
+        or by the replica with a sample of terms verified against Solr field analysis ('verify')
+        """
+        try:
+            self.term_normaliser_mode = config['DEFAULT']['term_normaliser_mode'].lower()
+            if self.term_normaliser_mode not in ('solr', 'local', 'verify'):
+                raise Exception("current setting [%s] for 'term_normaliser_mode' is not supported!" % self.term_normaliser_mode)
+        except KeyError:
+            self._logger.debug("'term_normaliser_mode' is not found in config file. Default to normalise terms by Solr.")
+            self.term_normaliser_mode = 'solr'
+
+        try:
+            self.term_normaliser_verify_sample_rate = float(config['DEFAULT']['term_normaliser_verify_sample_rate'])
+        except KeyError:
+            self.term_normaliser_verify_sample_rate = 0.01
+
+        self.term_normaliser_verified = 0
+        self.term_normaliser_divergences = 0
+
+        if self.term_normaliser_mode == 'solr':
+            self.local_term_normaliser = None
+        else:
+            from term_normaliser import LocalTermNormaliser
+            self.local_term_normaliser = LocalTermNormaliser(self.solr_term_normaliser)
+
+        self.load_normalised_term_cache_setting(config)
+
+    def load_normalised_term_cache_setting(self, config):
+        """
+        normalised terms are cached by (analyser field type, surface form) in a LRU cache backed by a sqlite store
+        """
+        try:
+            normalised_term_cache = config['DEFAULT']['normalised_term_cache']
+            normalised_term_cache = "true" == normalised_term_cache.lower()
+        except KeyError:
+            normalised_term_cache = False
+
+        if not normalised_term_cache:
+            self.term_cache = None
+            return
+
+        try:
+            cache_size = int(config['DEFAULT']['normalised_term_cache_size'])
+        except KeyError:
+            cache_size = 100000
+
+        try:
+            cache_file = config['DEFAULT']['normalised_term_cache_file']
+        except KeyError:
+            cache_file = os.path.join(os.path.dirname(__file__), '..', self.solr_core + "_normalised_terms.db")
+
+        # any change of the normaliser invalidates the cached normalised forms
+        if self.local_term_normaliser is None:
+            fingerprint = "solr:%s" % self.solr_term_normaliser
+        else:
+            fingerprint = "local:%s:%s" % (self.solr_term_normaliser, self.local_term_normaliser.version)
+
+        from cache_store import NormalisedTermCache
+        self.term_cache = NormalisedTermCache.get_instance(cache_file, fingerprint, max_size=cache_size)
+
+    def flush_caches(self):
+        """
+        write pending normalised terms into the normalised term cache store
+        """
+        if self.term_cache is not None:
+            self.term_cache.flush()
+
+    def normalised_term_cache_stats(self):
+        """
+        return dict, hit/miss statistics of normalised term cache in current process
+        """
+        return self.term_cache.stats() if self.term_cache is not None else {}
+
+    @property
+    def http(self):
+        if self._http is None:
+            if self._use_cache:
+                self._http = Http(cache=self._cache or ".cache",timeout=self.timeout)
+            else:
+                self._http = Http(timeout=self.timeout)
+        return self._http
+
+    def transport_stats(self):
+        """
+        return dict, connection reuse counters of the HTTP transport shared in current process
+        """
+        return self.transport.stats()
+
     
     def load_documents(self, start=0, rows=10):
         """
@@ -205,16 +485,74 @@ class SolrClient(object):
 
         return response['response']
 
-    def batch_update_documents(self, docs, commit=True):
+    def scan_document_pages(self, query_condition='*:*', fl=None, rows=None):
+        """
+        scan all the documents matched with the query condition by deep paging with cursorMark
+
+        Documents are sorted by the uniqueKey field ('solr_field_doc_id'), so the cost of every page is the same
+        at any depth of the index (unlike 'start' offsets).
+
+        :param query_condition: solr query condition, default '*:*'
+        :param fl: field list to fetch (list or comma separated string). All stored fields are fetched if None
+        :param rows: page size, default to 'scan_page_size' in [SOLR_CLIENT] config section
+        :return: generator of document pages (list of documents)
+        """
+        params = {'q': query_condition}
+        if fl:
+            params['fl'] = fl if isinstance(fl, str) else ','.join(fl)
+
+        for response in self._scan_responses('select', params, rows):
+            docs = response['response']['docs']
+            if docs:
+                yield docs
+
+    def _scan_responses(self, handler, params, rows=None):
+        """
+        deep paging with cursorMark sorted by the uniqueKey field over a request handler (e.g., 'select', 'tvrh')
+        :return: generator of responses
+        """
+        params = dict(params)
+        params['rows'] = self.scan_page_size if rows is None else rows
+        params['sort'] = '%s asc' % self.field_doc_id
+        params['wt'] = 'json'
+
+        cursor_mark = '*'
+        while True:
+            params['cursorMark'] = cursor_mark
+            path = '%s/%s?%s' % (self.path, handler, urlencode(params, True))
+            response = self._send_request('GET', path)
+            yield response
+
+            next_cursor_mark = response['nextCursorMark']
+            if next_cursor_mark == cursor_mark:
+                break
+            cursor_mark = next_cursor_mark
+
+    def scan_documents(self, query_condition='*:*', fl=None, rows=None):
+        """
+        scan all the documents matched with the query condition by deep paging with cursorMark
+        see SolrClient.scan_document_pages
+
+        :return: generator of documents
+        """
+        for docs in self.scan_document_pages(query_condition, fl=fl, rows=rows):
+            for doc in docs:
+                yield doc
+
+    def batch_update_documents(self, docs, commit=True, commit_within=None):
         """
         batch update documents
         
         docs: documment object set in dict json format
+        commit: hard commit after update
+        commit_within: optional, milliseconds within which the update will be committed by Solr
         """
         
         docs = json.dumps(docs, ensure_ascii=False).encode(encoding='utf_8')        
         
         params={'commit':'true' if commit else 'false'}
+        if commit_within is not None:
+            params['commitWithin'] = commit_within
         val_headers= {"Content-type": "application/json"}
         path = '%s/update/json?%s' % (self.path, urlencode(params, True))
         
@@ -228,6 +566,47 @@ class SolrClient(object):
         #{'responseHeader': {'status': 0, 'QTime': 115}}
         return response
 
+    def atomic_update_document(self, doc_id, field_values, modifier='set'):
+        """
+        document of Solr atomic (partial) update, which changes only the given fields of the indexed document
+        (keyed by 'solr_field_doc_id') instead of re-posting the whole stored document
+
+        Atomic update requires all the fields of the schema to be stored (except copyField destinations).
+
+        params:
+            doc_id, unique key of the document
+            field_values, dictionary of field name and new value
+            modifier, atomic update modifier ('set', 'add', 'remove', ...)
+        return dict, update document to be sent by batch_update_documents (or update buffer)
+        """
+        doc = {self.field_doc_id: doc_id}
+        for field, value in field_values.items():
+            doc[field] = {modifier: value}
+        return doc
+
+    def commit(self):
+        """
+        explicit hard commit to make all the pending updates visible to searchers
+        """
+        params = {'commit': 'true', 'wt': 'json'}
+        path = '%s/update?%s' % (self.path, urlencode(params, True))
+        return self._send_request('POST', path, data=b'{}', headers={"Content-type": "application/json"})
+
+    def update_buffer(self, batch_size=None, commit_policy=None, commit_within=None):
+        """
+        create an update buffer which sends documents in large batches without per-batch hard commits
+        Default settings are 'update_batch_size', 'update_commit_policy' and 'update_commit_within' in [SOLR_CLIENT]
+
+        Usage:
+            with solr_client.update_buffer() as updates:
+                updates.add(doc)
+        return SolrUpdateBuffer
+        """
+        return SolrUpdateBuffer(self,
+                                batch_size=self.update_batch_size if batch_size is None else batch_size,
+                                commit_policy=self.update_commit_policy if commit_policy is None else commit_policy,
+                                commit_within=self.update_commit_within if commit_within is None else commit_within)
+
     def update_document_by_url(self,doc_url,metadata=dict(),commit=True):
         """
         update documents by document url
@@ -273,6 +652,16 @@ class SolrClient(object):
         result = self.load_documents(rows=0)
         return result['numFound']
 
+    def index_version(self):
+        """
+        version of the index reported by the Luke request handler, which changes on every commit
+        return int
+        """
+        params = {'numTerms': 0, 'show': 'index', 'wt': 'json'}
+        path = '%s/admin/luke?%s' % (self.path, urlencode(params, True))
+        response = self._send_request('GET', path)
+        return response['index']['version']
+
     def term_vectors(self,q,field=None,**kwargs):
         """
         param:
@@ -306,6 +695,84 @@ class SolrClient(object):
             return result.tv[docId][p_field]
         else:
             return {}        
+
+    def batch_indexed_terms(self, doc_ids, p_field='content', tv_options=None, batch_size=None):
+        """
+        Batch mode of query_indexed_terms_by_docId to get the indexed terms of many documents
+
+        Term vectors of a batch of documents (see 'term_vector_batch_size' in [SOLR_CLIENT] config section) are
+        requested in one /tvrh request (as POST request body), with terms only by default, and are decoded directly
+        into term sets (see decode_term_vectors).
+
+        param:
+            doc_ids, document ids (values of 'solr_field_doc_id')
+            p_field, field of term vectors
+            tv_options, optional, 'tv.*' parameters overriding TERMS_ONLY_TV_OPTIONS
+            batch_size, optional, number of documents per request
+        return dict, document id -> set of indexed terms. Documents without term vectors are given an empty set.
+        """
+        batch_size = self.term_vector_batch_size if batch_size is None else batch_size
+
+        doc_ids = list(doc_ids)
+        indexed_terms = dict((doc_id, set()) for doc_id in doc_ids)
+        path = '%s/tvrh' % self.path
+        for next_cursor in range(0, len(doc_ids), batch_size):
+            current_doc_ids = doc_ids[next_cursor:next_cursor + batch_size]
+
+            params = self._term_vector_params(p_field, tv_options)
+            params['q'] = '%s:(%s)' % (self.field_doc_id,
+                                       ' OR '.join(SolrClient._quote_query_term(doc_id) for doc_id in current_doc_ids))
+            params['rows'] = len(current_doc_ids)
+            params['wt'] = 'json'
+            params['json.nl'] = 'map'
+
+            response = self._send_request('POST', path, data=urlencode(params, True).encode('utf-8'),
+                                          headers=FORM_HEADERS)
+            indexed_terms.update(decode_term_vectors(response.get('termVectors', []), p_field))
+
+        return indexed_terms
+
+    def scan_term_vector_pages(self, p_field='content', query_condition='*:*', rows=None, tv_options=None):
+        """
+        scan the indexed terms of all the documents matched with the query condition by deep paging over /tvrh
+        (see scan_document_pages)
+
+        :return: generator of dict (document id -> set of indexed terms) per page of documents
+        """
+        params = self._term_vector_params(p_field, tv_options)
+        params['q'] = query_condition
+        params['fl'] = self.field_doc_id
+        params['json.nl'] = 'map'
+
+        for response in self._scan_responses('tvrh', params, rows):
+            indexed_terms = decode_term_vectors(response.get('termVectors', []), p_field)
+            if indexed_terms:
+                yield indexed_terms
+
+    def scan_indexed_terms(self, p_field='content', query_condition='*:*', rows=None, tv_options=None):
+        """
+        scan the indexed terms of all the documents in the whole core (see scan_term_vector_pages)
+
+        :return: generator of (document id, set of indexed terms)
+        """
+        for indexed_terms in self.scan_term_vector_pages(p_field, query_condition, rows=rows, tv_options=tv_options):
+            for doc_id, terms in indexed_terms.items():
+                yield doc_id, terms
+
+    @staticmethod
+    def _term_vector_params(p_field, tv_options=None):
+        params = dict(TERMS_ONLY_TV_OPTIONS)
+        params['tv.fl'] = p_field
+        if tv_options:
+            params.update(tv_options)
+        return params
+
+    @staticmethod
+    def _quote_query_term(term):
+        """
+        quote a term as phrase in query, e.g., for document ids with special characters
+        """
+        return '"%s"' % term.replace('\\', '\\\\').replace('"', '\\"')
     
     def terms_query_longer_terms(self, field, subterm):
         """
@@ -367,6 +834,81 @@ class SolrClient(object):
             
         return dict([(k.replace('ttf(%s,\''%field,'').replace('\')',''),v) for k, v in resultSet.items()]), normed_terms_dict
 
+    def bulk_totaltermfreq(self, field, terms=set(), batch_size=None):
+        """
+        Bulk mode of totaltermfreq to get total term frequency for a whole candidate vocabulary
+
+        Terms are normalised and de-duplicated by normalised form before querying, and ttf function queries are
+        sent in large batches (see 'ttf_batch_size' in [SOLR_CLIENT] config section) as POST request bodies.
+
+        param:
+            field, content field where term total frequency will be counted
+            terms, a set of terms to query total frequency from the 'field'
+            batch_size, optional, number of ttf function queries per request
+        return tuple of two dictionaries as totaltermfreq:
+                1) term ttf dictionary with normalised term as key and ttf as value
+                2) normalised term dictionary with term as key and normed term as value
+        """
+        normed_terms_dict = dict((term, self.get_ttf_normalised_term(term)) for term in terms)
+        normed_terms = list(set(normed_terms_dict.values()))
+        self._logger.debug("requesting ttf of [%s] normalised terms for [%s] terms",
+                           len(normed_terms), len(normed_terms_dict))
+
+        ttf_dict = dict((normed_term, ttf) for normed_term, ttf in
+                        self.scan_totaltermfreq(field, normed_terms, batch_size=batch_size) if ttf is not None)
+        return ttf_dict, normed_terms_dict
+
+    def get_ttf_normalised_term(self, term):
+        """
+        return string, normalised term (see get_industry_term_field_analysis) escaped for ttf function query
+        """
+        return SolrClient._escpate_field_terms(self.get_industry_term_field_analysis(term))
+
+    def scan_totaltermfreq(self, field, normed_terms, batch_size=None):
+        """
+        Streaming mode of bulk_totaltermfreq: ttf function queries of normalised terms are sent in batches (see
+        'ttf_batch_size' in [SOLR_CLIENT] config section) as POST request bodies, and only one batch is kept in
+        memory at a time.
+
+        param:
+            field, content field where term total frequency will be counted
+            normed_terms, iterable of distinct normalised terms (see get_ttf_normalised_term)
+            batch_size, optional, number of ttf function queries per request
+        return generator of (normalised term, ttf) in order of normed_terms, where ttf is None if it is not returned
+        """
+        batch_size = self.ttf_batch_size if batch_size is None else batch_size
+
+        field_prefix = 'ttf(%s,\'' % field
+        val_headers = FORM_HEADERS
+        path = '%s/select' % self.path
+
+        is_empty_index = False
+        normed_terms = iter(normed_terms)
+        while True:
+            current_normed_terms = list(itertools.islice(normed_terms, batch_size))
+            if not current_normed_terms:
+                break
+
+            batch_ttf_dict = {}
+            if not is_empty_index:
+                params = {'q': '*:*', 'rows': 1, 'wt': 'json',
+                          'fl': ','.join(['ttf(%s,\'%s\')' % (field, normed_term) for normed_term in
+                                          current_normed_terms])}
+
+                response = self._send_request('POST', path, data=urlencode(params, True).encode('utf-8'),
+                                              headers=val_headers)
+
+                result = response['response']['docs']
+                if not result:
+                    self._logger.warning("No document is found for ttf function query. Index is empty?")
+                    is_empty_index = True
+                else:
+                    for k, v in result[0].items():
+                        batch_ttf_dict[k.replace(field_prefix, '').replace('\')', '')] = v
+
+            for normed_term in current_normed_terms:
+                yield normed_term, batch_ttf_dict.get(normed_term)
+
     @staticmethod
     def _escpate_field_terms(normed_term):
         """
@@ -384,13 +926,72 @@ class SolrClient(object):
         #'terms.sort':'count', 
         params={'terms.fl':fieldname,'terms.limit':-1}
         params['wt'] = 'json'
+        params['json.nl'] = 'map'
         path = '%s/terms?%s' % (self.path, urlencode(params, True))
         
         response=self._send_request('GET', path)
         
         all_terms=response['terms'][fieldname]
-        return list2dict(all_terms)
+        return named_list_to_dict(all_terms)
+
+    def iter_field_terms(self, fieldname, stream=True):
+        """
+        iterate all the terms in the given field with their document frequency
+
+        The /terms response is requested in xml and parsed incrementally as it is received (see iter_terms_xml) if
+        stream is True, so that large term lists are never materialised. Otherwise see field_terms.
+        return generator of (term, document frequency)
+        """
+        if not stream:
+            for term, df in self.field_terms(fieldname).items():
+                yield term, df
+            return
+
+        params = {'terms.fl': fieldname, 'terms.limit': -1}
+        params['wt'] = 'xml'
+        path = '%s/terms?%s' % (self.path, urlencode(params, True))
+
+        response = self._send_request('GET', path, stream=True)
+        try:
+            response.raw.decode_content = True
+            for term, df in iter_terms_xml(response.raw, fieldname):
+                yield term, df
+        finally:
+            response.close()
     
+    def scan_field_terms(self, fieldname, page_size=None):
+        """
+        scan all the terms in the given field with their document frequency by paging over the terms component
+
+        Terms are requested in index order in windows of 'terms_page_size' ([SOLR_CLIENT] config section) terms, and
+        every window starts after the last term of the previous one ('terms.lower' exclusive), so that only one
+        window is kept in memory at a time.
+        return generator of (term, document frequency)
+        """
+        page_size = self.terms_page_size if page_size is None else page_size
+
+        params = {'terms.fl': fieldname, 'terms.limit': page_size, 'terms.sort': 'index',
+                  'terms.lower.incl': 'false'}
+        params['wt'] = 'json'
+        # ordered [term, df] pairs
+        params['json.nl'] = 'arrarr'
+
+        lower = None
+        while True:
+            if lower is not None:
+                params['terms.lower'] = lower
+            path = '%s/terms?%s' % (self.path, urlencode(params, True))
+            response = self._send_request('GET', path)
+
+            num_terms = 0
+            for term, df in iter_named_list(response['terms'].get(fieldname, [])):
+                num_terms += 1
+                lower = term
+                yield term, df
+
+            if num_terms < page_size:
+                break
+
     def field_analysis(self, term, field_type="industry_term_type"):
         """
         run field analysis for the term by a given field_type (use pre-defined industry_term_type)
@@ -399,15 +1000,35 @@ class SolrClient(object):
         global sleep_seconds_before_field_analysis_request
         params={'analysis.fieldvalue':term,'analysis.fieldtype':field_type}
         params['wt'] = 'json'
+        params['json.nl'] = 'map'
         path = '%s/analysis/field?%s' % (self.path, urlencode(params, True))
         response=self._send_request('GET', path,sleep_before_request=sleep_seconds_before_field_analysis_request)
         analysis_result = response['analysis']
         
-        analysis_result= list2dict(analysis_result['field_types'][field_type]['index'])
+        analysis_result= named_list_to_dict(analysis_result['field_types'][field_type]['index'])
         
         return analysis_result
     
     def get_industry_term_field_analysis(self, term, pfield_type=None):
+        pfield_type = self.solr_term_normaliser if pfield_type is None else pfield_type
+        if self.term_cache is not None:
+            return self.term_cache.get_or_normalise(pfield_type, term,
+                                                    lambda term: self._normalise_term(term, pfield_type))
+        return self._normalise_term(term, pfield_type)
+
+    def _normalise_term(self, term, pfield_type):
+        if self.local_term_normaliser is not None and pfield_type == self.solr_term_normaliser:
+            normed_term = self.local_term_normaliser.normalise(term)
+            if self.term_normaliser_mode == 'verify' and random.random() < self.term_normaliser_verify_sample_rate:
+                self.verify_normalised_term(term, normed_term)
+            return normed_term
+
+        return self.get_solr_term_field_analysis(term, pfield_type)
+
+    def get_solr_term_field_analysis(self, term, pfield_type=None):
+        """
+        normalise term by Solr Field Analysis request handler
+        """
         pfield_type = self.solr_term_normaliser if pfield_type is None else pfield_type
         try:
             analysis_result = self.field_analysis(term, field_type=pfield_type)
@@ -418,13 +1039,52 @@ class SolrClient(object):
         
         return normed_term
     
+    def verify_normalised_term(self, term, normed_term):
+        """
+        compare a locally normalised term with Solr field analysis result of 'solr_term_normaliser'
+        return True if both are identical
+        """
+        solr_normed_term = self.get_solr_term_field_analysis(term)
+        self.term_normaliser_verified += 1
+        if solr_normed_term == normed_term:
+            return True
+
+        self.term_normaliser_divergences += 1
+        self._logger.warning("local term normaliser diverges from Solr [%s] for term [%s]: local [%s], solr [%s]. "
+                             "[%s] divergences in [%s] verified terms.", self.solr_term_normaliser, term, normed_term,
+                             solr_normed_term, self.term_normaliser_divergences, self.term_normaliser_verified)
+        return False
+
+    def verify_local_term_normaliser(self, terms, sample_size=100):
+        """
+        sample terms and compare the in-process term normaliser with Solr field analysis
+
+        return list, divergent tuples of (term, local normed term, solr normed term)
+        """
+        from term_normaliser import LocalTermNormaliser
+        local_term_normaliser = self.local_term_normaliser or LocalTermNormaliser(self.solr_term_normaliser)
+
+        terms = list(terms)
+        sampled_terms = random.sample(terms, sample_size) if len(terms) > sample_size else terms
+
+        divergences = []
+        for term in sampled_terms:
+            local_normed_term = local_term_normaliser.normalise(term)
+            solr_normed_term = self.get_solr_term_field_analysis(term)
+            if local_normed_term != solr_normed_term:
+                divergences.append((term, local_normed_term, solr_normed_term))
+
+        self._logger.info("[%s] of [%s] sampled terms diverge between local term normaliser and Solr [%s]",
+                          len(divergences), len(sampled_terms), self.solr_term_normaliser)
+        return divergences
+
     def get_accent_folding_norm_by_field_analysis(self, term, field_type="industry_term_type"):
         analysis_result = self.field_analysis(term, field_type="industry_term_type")
         
         accent_folding_norm = analysis_result['org.apache.lucene.analysis.miscellaneous.ASCIIFoldingFilter'][0]['text']
         return accent_folding_norm
 
-    def _send_request(self, method, path, data=None, headers=None, sleep_before_request=0):
+    def _send_request(self, method, path, data=None, headers=None, sleep_before_request=0, stream=False):
         """
 
         :param method: HTTP method include 'GET','POST','DELETE','PUT'
@@ -433,19 +1093,20 @@ class SolrClient(object):
         :param path: headers information
         :param sleep_before_request: sleep(timeinsec) to allow enough time gap to send requests to server
                             this is to avoid ConnectionError "Max retries exceeded with url". Default with no delay
-        :return: response in json format
+        :param stream: True to return the response without reading its body (e.g., for incremental parsing)
+        :return: response in json format, or the response object if stream is True
         """
 
         url = self.solrURL.replace(self.path, '')
         sleep(sleep_before_request)
         try:
-            if self._auth:
-                response = requests.request(method=method, url=urljoin(url, path),
-                                            headers=headers,data=data,auth=self._auth)
-            else:
-                response = requests.request(method=method, url=urljoin(url, path),
-                                            headers=headers,data=data)
-        except requests.exceptions.ConnectionError:
+            response = self.transport.request(method, urljoin(url, path), headers=headers, data=data,
+                                              auth=self._auth, timeout=self.http_timeout, stream=stream)
+        except requests.exceptions.Timeout:
+            self._logger.warning("Request timed out after [%s] seconds when requesting [%s]", self.http_timeout,
+                                 urljoin(url, path))
+            raise SolrError("Request timed out.")
+        except (requests.exceptions.ConnectionError, requests.exceptions.RetryError):
             self._logger.warning("Connection refused when requesting [%s]", urljoin(url, path))
             raise SolrError("Connection refused.")
 
@@ -453,6 +1114,8 @@ class SolrClient(object):
             self._logger.error("failed to send request to [%s]. Reason: [%s]", urljoin(url, path),response.reason)
             raise SolrError(self._extract_error(headers, response.reason))
 
+        if stream:
+            return response
         return response.json()
     
     def _extract_error(self, headers, response):
@@ -487,34 +1150,120 @@ class SolrError(Exception):
     pass
 
 
+class SolrUpdateBuffer(object):
+    """
+    Buffer of document updates sent in large JSON batches
+
+    Commit policies:
+        'phase', batches are sent with commit=false and one explicit commit is issued when the buffer is closed
+                (i.e., at the end of a pipeline phase)
+        'commitWithin', batches are sent with commitWithin (milliseconds) and one explicit commit is issued when
+                the buffer is closed
+        'batch', every batch is sent with commit=true
+    """
+    COMMIT_POLICIES = ('phase', 'commitWithin', 'batch')
+
+    def __init__(self, solr_client, batch_size=1000, commit_policy='phase', commit_within=60000):
+        self._logger = logging.getLogger(__name__)
+        self.solr_client = solr_client
+        self.batch_size = batch_size
+        self.commit_policy = commit_policy
+        self.commit_within = commit_within
+
+        self._docs = []
+        self.num_docs = 0
+        self.num_batches = 0
+
+    def add(self, doc):
+        self._docs.append(doc)
+        if len(self._docs) >= self.batch_size:
+            self.flush()
+
+    def add_all(self, docs):
+        for doc in docs:
+            self.add(doc)
+
+    def flush(self):
+        """
+        send buffered documents
+        """
+        if not self._docs:
+            return
+
+        docs, self._docs = self._docs, []
+        if self.commit_policy == 'batch':
+            self.solr_client.batch_update_documents(docs, commit=True)
+        elif self.commit_policy == 'commitWithin':
+            self.solr_client.batch_update_documents(docs, commit=False, commit_within=self.commit_within)
+        else:
+            self.solr_client.batch_update_documents(docs, commit=False)
+
+        self.num_docs += len(docs)
+        self.num_batches += 1
+        self._logger.debug("[%s] documents are sent in batch [%s]", len(docs), self.num_batches)
+
+    def close(self):
+        """
+        flush buffered documents and commit all the updates (unless committed by every batch)
+        """
+        self.flush()
+        if self.commit_policy != 'batch' and self.num_batches > 0:
+            self.solr_client.commit()
+        self._logger.info("[%s] documents are updated in [%s] batches with commit policy [%s]", self.num_docs,
+                          self.num_batches, self.commit_policy)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+            return False
+
+        # keep the updates done before the failure
+        try:
+            self.close()
+        except SolrError:
+            self._logger.exception("Failed to flush and commit buffered updates.")
+        return False
+
+
 
 def list2dict(data):
     # convert : [u'tf', 1, u'df', 2, u'tf-idf', 0.5]
-    # to a dict
-    stop = len(data)
-    keys = [data[i] for i in range(stop) if i%2==0]
-    values = [data[i] for i in range(stop) if i%2==1]
-    if keys[0] == 'start' or keys[0] == 'position':
-        #for positions, offsets
-        listOfDict=[]
-        kv_tuples=list(zip(keys,values))
-        for i in range(0,len(kv_tuples),2):
-            listOfDict.append(dict(kv_tuples[i:i+2]))
-        return listOfDict              
-    else:
-        return dict(list(zip(keys,values)))
+    # to a dict (see named_list.named_list_to_dict)
+    return named_list_to_dict(data)
 
 
 def nested_list2dict(data):
-    d = list2dict(data)
-    
-    if isinstance(d, dict):
-        for k, v in d.items():
-            if isinstance(v, list):
-                v = nested_list2dict(v)
-                
-            d[k] = v
-    return d
+    # see named_list.decode_named_list
+    return decode_named_list(data)
+
+
+def decode_term_vectors(term_vectors, field):
+    """
+    lean decoder of /tvrh term vectors in json NamedList of any 'json.nl' form (see named_list), e.g., 'flat':
+        ['uniqueKeyFieldName', 'id', '<doc id>', ['uniqueKey', '<doc id>', '<field>', ['<term>', [...], ...]], ...]
+
+    Only the term names of the field are read (tf, positions, offsets, etc. are not converted, unlike
+    nested_list2dict).
+    return dict, document id -> set of terms of the field
+    """
+    doc_terms = {}
+    for name, doc_tv in iter_named_list(term_vectors):
+        # skip 'uniqueKeyFieldName' and 'warnings'
+        if not isinstance(doc_tv, (list, dict)) or name == 'warnings':
+            continue
+
+        doc_id = name
+        terms = set()
+        for tv_name, value in iter_named_list(doc_tv):
+            if tv_name == 'uniqueKey':
+                doc_id = value
+            elif tv_name == field:
+                terms = set(named_list_names(value))
+        doc_terms[doc_id] = terms
+    return doc_terms
 
 
 def test_term_vectors():
@@ -542,6 +1291,13 @@ def test_query_indexed_terms_by_docId():
     index_terms = tatasteelClient.query_indexed_terms_by_docId(docId, "content")
     print(index_terms)
     
+def test_batch_indexed_terms():
+    tatasteelClient = SolrClient("http://localhost:8983/solr/tatasteel")
+    doc_ids = [doc[tatasteelClient.field_doc_id] for doc in tatasteelClient.load_documents(rows=10)['docs']]
+    for doc_id, terms in tatasteelClient.batch_indexed_terms(doc_ids, "content").items():
+        print(doc_id, len(terms))
+    print("documents with term vectors in whole index:", sum(1 for doc_terms in tatasteelClient.scan_indexed_terms("content")))
+
 def test_totaltermfreq():
     tatasteelClient = SolrClient("http://localhost:8983/solr/tatasteel")
     #term_candidates={'U.S.A.', 'V', 'Longitudinal S prints', 'S prints', 'transverse', 'area', 'strand', 'extends', 'Sollac', 'cast', 'Lucchini', 'MSM', 'drops', 'total thickness', 'side', 'country', 'Routine', 'Unimetal blooms', 'B219 steel code', 'B214', 'image', 'Saarstahl', 'light ic', '3rd HP rail Sequence', 'Grade', 'bloom format', 'format', 'cl Grade', 'martyn', 'Andrew Clark', 'scanner', 'final US rate'}
@@ -608,6 +1364,12 @@ def test_get_industry_term_field_analysis():
     print("normed term: ", normed_term)
 
 
+def test_verify_local_term_normaliser():
+    tatasteelClient = SolrClient("http://localhost:8983/solr/tatasteel")
+    term_candidates={"Defect bloom",'shift co-ordinator','Hayange Quality Problem','Life Ladle', 'BAD CUT', 'U.S.A.', 'manganese-alumino-silicates'}
+    divergences = tatasteelClient.verify_local_term_normaliser(term_candidates)
+    print("divergences: ", divergences)
+
 def test_update_document_by_url():
     tatasteelClient=SolrClient("http://localhost:8983/solr/tatasteel")
     doc_url="http://speak-pc.k-now.co.uk/uploads/attachment/attachment/6/leflet_v1.docx"
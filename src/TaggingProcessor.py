@@ -12,6 +12,8 @@ import os
 import sys
 import re
 from trie_dictionary_tagger import TrieNode
+from trie_dictionary_tagger import CompactTrie
+from fuzzy_dictionary_index import FuzzyDictionaryIndex, build_fuzzy_dictionary_index
 sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
 
 import logging
@@ -25,6 +27,8 @@ from FileUtil import load_terms_from_csv
 from trie_dictionary_tagger import levenshtein_similarity
 
 from multiprocPool import MultiprocPool
+from pos_pattern_matcher import PosPatternMatcher
+from dictionary_tagger import ExactDictionaryTagger
 
 #default levenshtein distance used to filter similar term
 LEVENSHTEIN_DISTANCE=3
@@ -47,6 +51,9 @@ def term_async_comparison(indexed_term, dict_terms, fuzzy=False, dict_terms_trie
         return indexed_term
     
     if fuzzy:
+        if isinstance(dict_terms_trie, FuzzyDictionaryIndex):
+            return indexed_term if dict_terms_trie.lookup(indexed_term, threshold) else ""
+        
         similar_terms = search(indexed_term, 3, dict_terms_trie)
         if similar_terms:
             filtered_similar_terms = [similar_term[0] for similar_term in similar_terms if levenshtein_similarity(indexed_term, similar_term[0]) >= threshold ]
@@ -55,6 +62,32 @@ def term_async_comparison(indexed_term, dict_terms, fuzzy=False, dict_terms_trie
                 return indexed_term
     
     return ""
+
+
+# fuzzy dictionary index loaded once per dictionary tagging worker process by pool initializer
+_dictionary_worker_context = {}
+
+
+def init_dictionary_tagging_worker(fuzzy_index, threshold):
+    """
+    dictionary tagging pool initializer
+
+    the fuzzy dictionary index is sent once per worker process (instead of once per task) and kept for every page
+    """
+    _dictionary_worker_context['fuzzy_index'] = fuzzy_index
+    _dictionary_worker_context['threshold'] = threshold
+
+
+def fuzzy_dictionary_matching_task(indexed_terms):
+    """
+    fuzzy matching of a chunk of indexed terms with the fuzzy dictionary index of current (dictionary tagging) worker
+    return list, indexed terms similar to any dictionary term
+    """
+    fuzzy_index = _dictionary_worker_context['fuzzy_index']
+    threshold = _dictionary_worker_context['threshold']
+    return [indexed_term for indexed_term in indexed_terms
+            if term_async_comparison(indexed_term, (), True, fuzzy_index, threshold)]
+
         
 class TaggingProcessor(object):
     pos_sequences_file=""
@@ -152,6 +185,11 @@ class TaggingProcessor(object):
         
         self.load_dictionary_tagging_setting(config)
         
+        #POS sequence grammars are loaded and compiled once per processor
+        self.pos_pattern_matcher = PosPatternMatcher(self.load_grammars())
+        
+        self.load_candidate_extraction_cache_setting(config)
+        
         try:
             self.parallel_workers=config['DEFAULT']['PARALLEL_WORKERS']
         except KeyError:
@@ -159,6 +197,18 @@ class TaggingProcessor(object):
             #raise Exception("Please check 'PARALLEL_WORKERS' is properly configured!")
             self.parallel_workers = 1    
         
+        #processes of the long-lived dictionary tagging pool, 1 for fuzzy matching in current process
+        #(e.g., in tagging workers, see IndustryTermRecogniser.init_tagging_worker)
+        self.dict_tagging_workers = int(self.parallel_workers)
+        self._dict_tagging_pool = None
+        
+        try:
+            self.frequency_filtering_mode=config['DEFAULT']['frequency_filtering_mode']
+            if self.frequency_filtering_mode not in ('document', 'corpus'):
+                raise Exception("current setting [%s] for 'frequency_filtering_mode' is not supported!"%self.frequency_filtering_mode)
+        except KeyError:
+            self.frequency_filtering_mode='document'
+        
     def load_dictionary_tagging_setting(self, config):
         try:
             self.dict_tagging = config['DICTIONARY_TAGGER']['dict_tagging']
@@ -207,20 +257,91 @@ class TaggingProcessor(object):
         self.dict_terms = [self.solrClient.get_industry_term_field_analysis(dict_term) for dict_term in self.dict_terms]
         self._logger.info("dictionary terms are normalised and loaded successfully. Total dictionary term size is [%s]", str(len(self.dict_terms)))
         
+        self.exact_dict_tagger = ExactDictionaryTagger(self.dict_terms)
+        
+        try:
+            self.dict_tagger_exact_source=config['DICTIONARY_TAGGER']['dict_tagger_exact_source']
+            if self.dict_tagger_exact_source not in ('term_vector', 'text'):
+                raise Exception("current setting [%s] for 'dict_tagger_exact_source' is not supported!"%self.dict_tagger_exact_source)
+        except KeyError:
+            self.dict_tagger_exact_source='term_vector'
+        
+        if self.dict_tagger_exact_source == 'text':
+            from term_normaliser import LocalTermNormaliser
+            self.dict_text_normaliser = self.solrClient.local_term_normaliser or LocalTermNormaliser(self.solrClient.solr_term_normaliser)
+        
+        try:
+            self.dict_tagger_fuzzy_index=config['DICTIONARY_TAGGER']['dict_tagger_fuzzy_index']
+        except KeyError:
+            self.dict_tagger_fuzzy_index='trie'
+        
         if self.dict_tagger_fuzzy_matching:
-            self._logger.info("loading into Trie nodes for fuzzy matching...")
-            self.dict_terms_trie = TrieNode()
-            [self.dict_terms_trie.insert(normed_term) for normed_term in self.dict_terms]
-            self._logger.info("loaded into Trie nodes successfully.")
+            self._logger.info("loading dictionary terms into [%s] index for fuzzy matching...", self.dict_tagger_fuzzy_index)
+            self.dict_terms_trie = build_fuzzy_dictionary_index(self.dict_tagger_fuzzy_index, self.dict_terms,
+                                                                self.dict_tagger_sim_threshold)
+            self._logger.info("loaded into fuzzy dictionary index successfully.")
         else:
-            self.dict_terms_trie = TrieNode()
+            self.dict_terms_trie = CompactTrie()
+        
+    def load_candidate_extraction_cache_setting(self, config):
+        """
+        linguistically filtered candidates of every document content are cached in a sqlite store (see CandidateExtractionCache)
+        """
+        try:
+            candidate_extraction_cache = config['DEFAULT']['candidate_extraction_cache']
+            candidate_extraction_cache = "true" == candidate_extraction_cache.lower()
+        except KeyError:
+            candidate_extraction_cache = False
         
+        if not candidate_extraction_cache:
+            self.candidate_cache = None
+            return
+        
+        try:
+            cache_file = config['DEFAULT']['candidate_extraction_cache_file']
+        except KeyError:
+            cache_file = os.path.join(os.path.dirname(__file__), '..', self.solrClient.solr_core + "_candidate_extraction.db")
+        
+        from cache_store import CandidateExtractionCache
+        self.candidate_cache = CandidateExtractionCache.get_instance(cache_file, self.candidate_extraction_fingerprint())
+    
+    def candidate_extraction_fingerprint(self):
+        """
+        fingerprint of the settings which candidate extraction (before frequency filtering) depends on
+        """
+        import hashlib
+        import json
+        settings = {'grammars': self.pos_pattern_matcher.tag_patterns,
+                    'stopwords': sorted(self.stopword_list),
+                    'min_tokens': self._min_tokens,
+                    'max_tokens': self._max_tokens,
+                    'min_char_length': self._min_char_length}
+        return hashlib.sha1(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()
+    
+    def candidate_extraction_cache_stats(self):
+        """
+        return dict, hit/miss statistics of candidate extraction cache in current process
+        """
+        return self.candidate_cache.stats() if self.candidate_cache is not None else {}
+    
+    def flush_caches(self):
+        if self.candidate_cache is not None:
+            self.candidate_cache.flush()
+        self.solrClient.flush_caches()
+    
     def load_grammars(self):
+        """
+        load POS sequence patterns from 'pos_sequence_filter' file
+        comment lines, inline comments (start with '#') and blank lines are skipped
+        return list, tag patterns
+        """
         grammars=[]
         
         pos_sequences = read_by_line(self.pos_sequences_file)
         for sequence_str in pos_sequences:
-            grammars.append(sequence_str.replace('\n','').strip())
+            sequence_str = sequence_str.replace('\n','').split('#', 1)[0].strip()
+            if sequence_str:
+                grammars.append(sequence_str)
         
         return grammars
     
@@ -232,24 +353,39 @@ class TaggingProcessor(object):
         for node_a in candidate_chunk:
             if type(node_a) is nltk.Tree:
                 if node_a.label() == 'TermCandidate':
-                    term_tokens=[]
-                    for node_b in node_a:
-                        if node_b[0] == '"':
-                            #TODO: find a more elegant way to deal with spurious POS tagging for quotes
-                            continue
-                        if node_b[1] == 'POS':
-                            term_tokens.append(node_b[0])
-                        elif node_b[1] == 'DT':
-                            #only append if DT is in the middle,e.g., ratio of the tensile
-                            term_tokens.append('' if len(term_tokens) == 0 else node_b[0])
-                            #continue
-                        else:
-                            term_tokens.append('' if len(term_tokens) == 0 else ' ')
-                            term_tokens.append(node_b[0])
-                    
-                    term_candidates.add(''.join(term_tokens))
+                    term_candidates.add(self.chunk_to_candidate(node_a))
         return term_candidates
     
+    def parsing_candidates(self, text_pos_tokens):
+        """
+        match POS tagged sentence with all the POS sequence grammars in one pass (see PosPatternMatcher)
+        return set, term candidates
+        """
+        spans = self.pos_pattern_matcher.spans([pos_tag for token, pos_tag in text_pos_tokens])
+        return set(self.chunk_to_candidate(text_pos_tokens[start:end]) for start, end in spans)
+    
+    @staticmethod
+    def chunk_to_candidate(chunk):
+        """
+        join chunked (token, POS tag) sequence into term candidate
+        """
+        term_tokens=[]
+        for node_b in chunk:
+            if node_b[0] == '"':
+                #TODO: find a more elegant way to deal with spurious POS tagging for quotes
+                continue
+            if node_b[1] == 'POS':
+                term_tokens.append(node_b[0])
+            elif node_b[1] == 'DT':
+                #only append if DT is in the middle,e.g., ratio of the tensile
+                term_tokens.append('' if len(term_tokens) == 0 else node_b[0])
+                #continue
+            else:
+                term_tokens.append('' if len(term_tokens) == 0 else ' ')
+                term_tokens.append(node_b[0])
+        
+        return ''.join(term_tokens)
+    
     def sentence_split(self, content):
         """
         heuristic/pattern (e.g., by '\r\n' or '\t') based sentence splitting + NLTK's recommended sentence tokenizer         
@@ -264,61 +400,163 @@ class TaggingProcessor(object):
         sent_list = [item for sublist in sent_list for item in sublist]
         return sent_list
     
-    def term_dictionary_tagging(self, doc_id):
+    def term_dictionary_tagging(self, doc_id, content=None):
         """
         tagging content with the statistic dictionary 
+        
+        see batch_term_dictionary_tagging
+        
+        params:
+            doc_id, document id
+            content, optional, document content for exact matching over text
         return set, term set to be indexed
         """
-
-        self._logger.debug("term dictionary tagging for single document ...")
+        return self.batch_term_dictionary_tagging([(doc_id, content)])[doc_id]
+    
+    def batch_term_dictionary_tagging(self, docs):
+        """
+        tagging a page of documents with the statistic dictionary
         
-        indexed_terms = self.solrClient.query_indexed_terms_by_docId(doc_id, self.solr_field_content)
-        indexed_terms = set(indexed_terms.keys())
+        Exact matching is done in one pass per document by the ExactDictionaryTagger, either over the term vector of
+        the document or over the document content ('dict_tagger_exact_source'). Term vectors of the page are fetched
+        in batch (see SolrClient.batch_indexed_terms). The indexed terms which are not matched exactly are
+        deduplicated across the page and compared once by fuzzy matching (see fuzzy_dictionary_matching).
         
-        with MultiprocPool(processes=int(self.parallel_workers)) as pool:
-            tagged_terms=pool.starmap(term_async_comparison, [(indexed_term, self.dict_terms, self.dict_tagger_fuzzy_matching, self.dict_terms_trie, self.dict_tagger_sim_threshold) for indexed_term in indexed_terms])
-       
-        tagged_terms = set(filter(None, set(tagged_terms)))
-        self._logger.debug("final dictionary tagged terms size: [%s]", str(len(tagged_terms)))
-            
-        self._logger.debug("Term candidate extraction for current doc is completed.")
+        Per-document tagging latency (exact matching + shares of page term vector fetching and fuzzy matching) is
+        logged.
+        
+        params:
+            docs, list of (document id, document content or None)
+        return dict, document id -> term set to be indexed
+        """
+        import time
+        
+        tagged_terms = {}
+        unmatched_terms = {}
+        latency = {}
+        term_vector_doc_ids = []
+        for doc_id, content in docs:
+            if self.dict_tagger_exact_source == 'text' and content is not None and not self.dict_tagger_fuzzy_matching:
+                start = time.time()
+                tagged_terms[doc_id] = self.exact_dict_tagger.tag_text(content, self.dict_text_normaliser)
+                latency[doc_id] = time.time() - start
+            else:
+                term_vector_doc_ids.append(doc_id)
+        
+        if term_vector_doc_ids:
+            start = time.time()
+            page_indexed_terms = self.solrClient.batch_indexed_terms(term_vector_doc_ids, self.solr_field_content)
+            fetching_time = (time.time() - start) / len(term_vector_doc_ids)
+            for doc_id in term_vector_doc_ids:
+                start = time.time()
+                indexed_terms = page_indexed_terms.get(doc_id, set())
+                tagged_terms[doc_id] = set(self.exact_dict_tagger.tag_terms(indexed_terms))
+                if self.dict_tagger_fuzzy_matching:
+                    unmatched_terms[doc_id] = indexed_terms - tagged_terms[doc_id]
+                latency[doc_id] = fetching_time + time.time() - start
+        
+        total_unmatched = sum(len(terms) for terms in unmatched_terms.values())
+        if total_unmatched:
+            start = time.time()
+            fuzzy_tagged_terms = self.fuzzy_dictionary_matching(set().union(*unmatched_terms.values()))
+            fuzzy_matching_time = time.time() - start
+            for doc_id, terms in unmatched_terms.items():
+                tagged_terms[doc_id].update(terms & fuzzy_tagged_terms)
+                latency[doc_id] += fuzzy_matching_time * len(terms) / total_unmatched
+        
+        for doc_id, doc_latency in latency.items():
+            self._logger.debug("document [%s] is tagged with [%s] dictionary terms in [%.1f] ms", doc_id,
+                               len(tagged_terms[doc_id]), 1000 * doc_latency)
+        if latency:
+            self._logger.info("dictionary tagging of [%s] documents: [%.1f] ms per document on average, [%.1f] ms at "
+                              "most", len(latency), 1000 * sum(latency.values()) / len(latency),
+                              1000 * max(latency.values()))
         return tagged_terms
+    
+    def fuzzy_dictionary_matching(self, indexed_terms):
+        """
+        fuzzy matching of indexed terms with the fuzzy dictionary index ('dict_tagger_fuzzy_index'), chunked over the
+        long-lived dictionary tagging pool (see dictionary_tagging_pool) or in current process if there is only one
+        dictionary tagging worker
+        
+        return set, indexed terms similar to any dictionary term
+        """
+        indexed_terms = sorted(indexed_terms)
+        if self.dict_tagging_workers <= 1:
+            return set(indexed_term for indexed_term in indexed_terms if
+                       term_async_comparison(indexed_term, (), True, self.dict_terms_trie,
+                                             self.dict_tagger_sim_threshold))
+        
+        #a few chunks per worker for load balancing
+        chunk_size = max(1, -(-len(indexed_terms) // (self.dict_tagging_workers * 4)))
+        chunks = [indexed_terms[i:i + chunk_size] for i in range(0, len(indexed_terms), chunk_size)]
+        fuzzy_tagged_terms = set()
+        for matched_terms in self.dictionary_tagging_pool().map(fuzzy_dictionary_matching_task, chunks):
+            fuzzy_tagged_terms.update(matched_terms)
+        return fuzzy_tagged_terms
+    
+    def dictionary_tagging_pool(self):
+        """
+        return MultiprocPool, dictionary tagging pool created on first use and reused for every page of documents.
+                The fuzzy dictionary index is loaded once per worker (see init_dictionary_tagging_worker).
+        """
+        if self._dict_tagging_pool is None:
+            self._logger.info("starting dictionary tagging pool with [%s] workers ...", self.dict_tagging_workers)
+            self._dict_tagging_pool = MultiprocPool(processes=self.dict_tagging_workers,
+                                                    initializer=init_dictionary_tagging_worker,
+                                                    initargs=(self.dict_terms_trie, self.dict_tagger_sim_threshold))
+        return self._dict_tagging_pool
+    
+    def close_dictionary_tagging_pool(self):
+        if self._dict_tagging_pool is not None:
+            self._dict_tagging_pool.close()
+            self._dict_tagging_pool.join()
+            self._dict_tagging_pool = None
         
-    def term_candidate_extraction(self,content):
+    def term_candidate_extraction(self,content, frequency_filtering=True):
         """
         Sentence based term candidates extraction. The content need to be tokenised and sentence splitted before parsing.
         params:
             content: content string to be analysed
+            frequency_filtering: False to skip frequency filtering (e.g., for corpus level filtering over the whole
+                                candidate vocabulary later, see 'frequency_filtering_mode')
         return set, term candidates extracted from content
         """
         self._logger.debug("term candidate extraction for single document...")
         
-        term_candidates=set()
-        grammars=['TermCandidate: {'+item+'}' for item in self.load_grammars() if not item.startswith('#')]
-        
-        sent_tokenize_list = self.sentence_split(content)
-        
-        for sent_content in sent_tokenize_list:
-            pos_sent_content=self.linguistic_processor.customised_preprocessing(sent_content)
-            # print(pos_sent_content)
-            for candidate_grammar in grammars:
-                pos_filter_candidates=self.parsing_candidates_regexp(pos_sent_content,candidate_grammar)
-                term_candidates.update(pos_filter_candidates)
+        term_candidates = self.candidate_cache.get(content) if self.candidate_cache is not None else None
+        if term_candidates is not None:
+            self._logger.debug("linguistically filtered candidates are loaded from cache: [%s]", len(term_candidates))
+        else:
+            term_candidates=set()
+            
+            sent_tokenize_list = self.sentence_split(content)
             
-        self._logger.debug("term_candidates size after PoS filtering: [%s]", len(term_candidates))
-        term_candidates = self.linguistic_filter(term_candidates)
+            #all sentences of the document are POS tagged in one batch
+            for pos_sent_content in self.linguistic_processor.batch_customised_preprocessing(sent_tokenize_list):
+                # print(pos_sent_content)
+                term_candidates.update(self.parsing_candidates(pos_sent_content))
+                
+            self._logger.debug("term_candidates size after PoS filtering: [%s]", len(term_candidates))
+            term_candidates = self.linguistic_filter(term_candidates)
+            
+            if self.candidate_cache is not None:
+                self.candidate_cache.put(content, term_candidates)
         # print(term_candidates)
-        term_candidates = self.frequency_filtering(term_candidates)
+        if frequency_filtering:
+            term_candidates = self.frequency_filtering(term_candidates)
         
         self._logger.debug("Term candidate extraction for current doc is completed.")
         return term_candidates
     
-    def frequency_filtering(self, term_candidates):
+    def frequency_filtering(self, term_candidates, ttf_tables=None):
         """
         Corpus (whole index) based frequency filtering
         
         params:
             term_candidates: set()
+            ttf_tables: optional, tuple of (term ttf dictionary, normalised term dictionary) of candidate vocabulary
+                        (as returned by SolrClient.bulk_totaltermfreq). ttf of the candidates is requested if not given.
         
         return set, filtered term candidates
         """
@@ -326,7 +564,10 @@ class TaggingProcessor(object):
         self._logger.debug("term frequency filtering for candidates [%s] by min frequency [%s]  ...",str(len(term_candidates)), str(self._min_term_freq))
         filtered_term_candidates=set()
         
-        terms_ttf_dict, normed_terms_dict= self.solrClient.totaltermfreq(self.solr_field_content, term_candidates)
+        if ttf_tables is None:
+            terms_ttf_dict, normed_terms_dict= self.solrClient.totaltermfreq(self.solr_field_content, term_candidates)
+        else:
+            terms_ttf_dict, normed_terms_dict= ttf_tables
         
         if self._min_term_freq > 1:
             for term in term_candidates:
@@ -0,0 +1,303 @@
+"""
+Persistent caches shared by batch runs and pool workers
+
+NormalisedTermCache, normalised term forms keyed by (analyser field type, surface form)
+CandidateExtractionCache, term candidates extracted from document content keyed by content hash and extraction settings
+"""
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import logging
+import sqlite3
+import atexit
+import multiprocessing.util
+import hashlib
+import json
+from collections import OrderedDict
+
+
+class NormalisedTermCache(object):
+    """
+    Normalised term cache with bounded in-memory LRU eviction backed by a sqlite store.
+
+    The sqlite store survives between batch runs and is opened (in WAL mode) by every pool worker, so terms
+    normalised by one process can be read by all the others. Writes are buffered and flushed in batches.
+
+    The cache is invalidated automatically when the normaliser fingerprint (e.g., 'solr_term_normaliser' and
+    normalisation mode) is different from the one the store was built with.
+    """
+    _instances = {}
+
+    def __init__(self, db_path, fingerprint, max_size=100000, flush_size=1000):
+        self._logger = logging.getLogger(__name__)
+
+        self.db_path = db_path
+        self.fingerprint = fingerprint
+        self.max_size = max_size
+        self.flush_size = flush_size
+
+        self._lru = OrderedDict()
+        self._pending = []
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        # the store is opened on first lookup
+        self._conn = None
+        self._opened = False
+
+        atexit.register(self.flush)
+        # pool workers exit without atexit handlers, but run multiprocessing finalizers when the pool is closed
+        multiprocessing.util.Finalize(self, self.flush, exitpriority=10)
+
+    @classmethod
+    def get_instance(cls, db_path, fingerprint, max_size=100000, flush_size=1000):
+        """
+        return the cache of current process for the store path
+        """
+        key = (os.getpid(), db_path)
+        cache = cls._instances.get(key)
+        if cache is None or cache.fingerprint != fingerprint:
+            cache = cls(db_path, fingerprint, max_size=max_size, flush_size=flush_size)
+            cls._instances[key] = cache
+        return cache
+
+    def _connection(self):
+        if not self._opened:
+            self._opened = True
+            try:
+                self._conn = self._open(self.db_path, self.fingerprint)
+            except sqlite3.Error:
+                self._logger.exception("Failed to open normalised term cache [%s]. Continue with in-memory cache only.",
+                                       self.db_path)
+        return self._conn
+
+    def _open(self, db_path, fingerprint):
+        conn = sqlite3.connect(db_path, timeout=60)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('''create table IF NOT EXISTS cache_meta(meta_key TEXT PRIMARY KEY, meta_value TEXT)''')
+        conn.execute('''create table IF NOT EXISTS normalised_terms(field_type TEXT, term TEXT, normed_term TEXT,
+                        PRIMARY KEY (field_type, term))''')
+
+        row = conn.execute("select meta_value from cache_meta where meta_key='fingerprint'").fetchone()
+        if row is None or row[0] != fingerprint:
+            if row is not None:
+                self._logger.info("term normaliser is changed from [%s] to [%s]. Invalidating normalised term cache [%s]",
+                                  row[0], fingerprint, db_path)
+            with conn:
+                conn.execute('delete from normalised_terms')
+                conn.execute("INSERT OR REPLACE INTO cache_meta(meta_key, meta_value) VALUES('fingerprint', ?)",
+                             [fingerprint])
+        return conn
+
+    def get(self, field_type, term):
+        """
+        return normalised term or None if not cached
+        """
+        key = (field_type, term)
+        normed_term = self._lru.get(key)
+        if normed_term is not None:
+            self._lru.move_to_end(key)
+            self.hits += 1
+            return normed_term
+
+        conn = self._connection()
+        if conn is not None:
+            row = conn.execute('select normed_term from normalised_terms where field_type=? and term=?',
+                               key).fetchone()
+            if row is not None:
+                self.disk_hits += 1
+                self._remember(key, row[0])
+                return row[0]
+
+        self.misses += 1
+        return None
+
+    def put(self, field_type, term, normed_term):
+        key = (field_type, term)
+        self._remember(key, normed_term)
+
+        if self._connection() is not None:
+            self._pending.append((field_type, term, normed_term))
+            if len(self._pending) >= self.flush_size:
+                self.flush()
+
+    def get_or_normalise(self, field_type, term, normalise_func):
+        """
+        return cached normalised term, or normalise term by the normalise_func(term) and cache the result
+        """
+        normed_term = self.get(field_type, term)
+        if normed_term is None:
+            normed_term = normalise_func(term)
+            self.put(field_type, term, normed_term)
+        return normed_term
+
+    def _remember(self, key, normed_term):
+        self._lru[key] = normed_term
+        self._lru.move_to_end(key)
+        if len(self._lru) > self.max_size:
+            self._lru.popitem(last=False)
+
+    def flush(self):
+        """
+        write pending normalised terms into the sqlite store
+        """
+        if self._conn is None or not self._pending:
+            return
+        pending, self._pending = self._pending, []
+        try:
+            with self._conn:
+                self._conn.executemany('INSERT OR REPLACE INTO normalised_terms(field_type, term, normed_term) '
+                                       'VALUES(?,?,?)', pending)
+        except sqlite3.Error:
+            self._logger.exception("Failed to write [%s] normalised terms into cache [%s]", len(pending), self.db_path)
+
+    def stats(self):
+        """
+        return dict, hit/miss statistics of current process
+        """
+        lookups = self.hits + self.disk_hits + self.misses
+        return {'hits': self.hits,
+                'disk_hits': self.disk_hits,
+                'misses': self.misses,
+                'size': len(self._lru),
+                'hit_ratio': ((self.hits + self.disk_hits) / lookups) if lookups else 0.0}
+
+    def close(self):
+        self.flush()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        NormalisedTermCache._instances.pop((os.getpid(), self.db_path), None)
+
+
+class CandidateExtractionCache(object):
+    """
+    On-disk cache of the linguistically filtered term candidates of every document content.
+
+    Entries are keyed by the hash of the settings fingerprint (e.g., POS sequence grammars, stopwords, min/max tokens)
+    and the document content, so that re-tagging an unchanged document with unchanged settings skips sentence
+    splitting, POS tagging and chunking. Any change of the settings gives new keys.
+
+    The sqlite store (in WAL mode) is shared by batch runs and tagging workers. Writes are buffered and flushed in
+    batches (and by flush() at the end of every page of documents).
+    """
+    _instances = {}
+
+    def __init__(self, db_path, fingerprint, flush_size=100):
+        self._logger = logging.getLogger(__name__)
+
+        self.db_path = db_path
+        self.fingerprint = fingerprint
+        self.flush_size = flush_size
+
+        # content key -> serialised candidates not written yet
+        self._pending = {}
+
+        self.hits = 0
+        self.misses = 0
+
+        # the store is opened on first lookup
+        self._conn = None
+        self._opened = False
+
+        atexit.register(self.flush)
+        # pool workers exit without atexit handlers, but run multiprocessing finalizers when the pool is closed
+        multiprocessing.util.Finalize(self, self.flush, exitpriority=10)
+
+    @classmethod
+    def get_instance(cls, db_path, fingerprint, flush_size=100):
+        """
+        return the cache of current process for the store path
+        """
+        key = (os.getpid(), db_path)
+        cache = cls._instances.get(key)
+        if cache is None or cache.fingerprint != fingerprint:
+            cache = cls(db_path, fingerprint, flush_size=flush_size)
+            cls._instances[key] = cache
+        return cache
+
+    def _connection(self):
+        if not self._opened:
+            self._opened = True
+            try:
+                conn = sqlite3.connect(self.db_path, timeout=60)
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('''create table IF NOT EXISTS extracted_candidates(content_key TEXT PRIMARY KEY,
+                                candidates TEXT)''')
+                self._conn = conn
+            except sqlite3.Error:
+                self._logger.exception("Failed to open candidate extraction cache [%s]. Continue without cache.",
+                                       self.db_path)
+        return self._conn
+
+    def content_key(self, content):
+        """
+        return string, hash of settings fingerprint and document content
+        """
+        digest = hashlib.sha1(self.fingerprint.encode('utf-8'))
+        digest.update(b'\0')
+        digest.update(content.encode('utf-8'))
+        return digest.hexdigest()
+
+    def get(self, content):
+        """
+        return set, cached term candidates, or None if the content is not cached
+        """
+        content_key = self.content_key(content)
+        candidates = self._pending.get(content_key)
+        if candidates is None:
+            conn = self._connection()
+            if conn is not None:
+                row = conn.execute('select candidates from extracted_candidates where content_key=?',
+                                   [content_key]).fetchone()
+                if row is not None:
+                    candidates = row[0]
+
+        if candidates is not None:
+            self.hits += 1
+            return set(json.loads(candidates))
+
+        self.misses += 1
+        return None
+
+    def put(self, content, candidates):
+        if self._connection() is None:
+            return
+
+        self._pending[self.content_key(content)] = json.dumps(sorted(candidates), ensure_ascii=False)
+        if len(self._pending) >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        """
+        write pending candidates into the sqlite store
+        """
+        if self._conn is None or not self._pending:
+            return
+        pending, self._pending = self._pending, {}
+        try:
+            with self._conn:
+                self._conn.executemany('INSERT OR REPLACE INTO extracted_candidates(content_key, candidates) '
+                                       'VALUES(?,?)', pending.items())
+        except sqlite3.Error:
+            self._logger.exception("Failed to write candidates of [%s] documents into cache [%s]", len(pending),
+                                   self.db_path)
+
+    def stats(self):
+        """
+        return dict, hit/miss statistics of current process
+        """
+        lookups = self.hits + self.misses
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': (self.hits / lookups) if lookups else 0.0}
+
+    def close(self):
+        self.flush()
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+        CandidateExtractionCache._instances.pop((os.getpid(), self.db_path), None)
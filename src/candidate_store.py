@@ -0,0 +1,509 @@
+"""
+Columnar store of the candidate vocabulary and ranking statistics under a run directory
+
+    candidates.vocab, candidate terms and their df (VocabularyStore). The candidate id is the position of a term.
+    normed_terms.vocab, distinct normalised forms ('solr_term_normaliser') in sorted order with their ttf in place of
+                        df (VocabularyStore)
+    normed_ids.i64, normalised form id of every candidate
+    normed_candidates.vocab, simply normalised form (see util.TermUtil.normalise) of every candidate in candidate id
+                             order with its number of tokens in place of df (VocabularyStore)
+    tokens.vocab, distinct tokens of simply normalised forms with the number of candidates containing them in place
+                  of df (VocabularyStore)
+    postings.i64, ids of candidates containing every token (in token order), i.e., posting lists of the
+                  subsumption index (see subsumption_index.SubsumptionIndex)
+    posting_offsets.i64, start of the posting list of every token in postings.i64 (and end of the last one)
+    cvalues.f64, C-value of every candidate
+    ranking.i64, candidate ids in descending order of C-value
+    index_version, version of the Solr index the candidates are exported from (see SolrClient.index_version)
+
+Columns are raw arrays (in the byte order of the machine) memory mapped on demand, so every stage and every worker
+process reads the same pages instead of holding dictionaries of str -> int.
+"""
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import contextlib
+import heapq
+import itertools
+import logging
+import mmap
+import operator
+import struct
+import tempfile
+from array import array
+
+from util import TermUtil
+from vocabulary_store import VocabularyStore
+
+
+class _Column(object):
+    """
+    read-only memory mapped array
+    """
+
+    def __init__(self, path, typecode):
+        self._file = open(path, 'rb')
+        self._mmap = None
+        if os.fstat(self._file.fileno()).st_size == 0:
+            # empty file cannot be mapped
+            self.values = array(typecode)
+        else:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.values = memoryview(self._mmap).cast(typecode)
+
+    def close(self):
+        if self._mmap is not None:
+            self.values.release()
+            self._mmap.close()
+            self._mmap = None
+        self._file.close()
+
+
+class _SortedSpill(object):
+    """
+    External sort of (term, id) records
+
+    Records are sorted in chunks of chunk_size records and every sorted chunk is spilled into a temporary run file
+    (in the given directory). Runs are merged on iteration, so that at most one chunk is kept in memory.
+    """
+    _RECORD_HEADER = struct.Struct('=qq')
+
+    def __init__(self, directory, chunk_size):
+        self.directory = directory
+        self.chunk_size = chunk_size
+        self._chunk = []
+        self._runs = []
+
+    def add(self, term, record_id):
+        self._chunk.append((term.encode('utf-8'), record_id))
+        if len(self._chunk) >= self.chunk_size:
+            self._spill()
+
+    def _spill(self):
+        self._chunk.sort()
+        run = tempfile.TemporaryFile(dir=self.directory)
+        for encoded, record_id in self._chunk:
+            run.write(self._RECORD_HEADER.pack(record_id, len(encoded)))
+            run.write(encoded)
+        run.seek(0)
+        self._runs.append(run)
+        self._chunk = []
+
+    def _read_run(self, run):
+        while True:
+            header = run.read(self._RECORD_HEADER.size)
+            if not header:
+                return
+            record_id, length = self._RECORD_HEADER.unpack(header)
+            yield run.read(length), record_id
+
+    def __iter__(self):
+        """
+        return generator of (term, id) in ascending order of term (UTF-8 byte order) and id. Run files are removed
+                once all the records are read.
+        """
+        self._chunk.sort()
+        try:
+            for encoded, record_id in heapq.merge(*([self._read_run(run) for run in self._runs] + [self._chunk])):
+                yield encoded.decode('utf-8'), record_id
+        finally:
+            self.close()
+
+    def close(self):
+        for run in self._runs:
+            run.close()
+        self._runs = []
+        self._chunk = []
+
+
+class CandidateStore(object):
+    """
+    Candidate vocabulary and statistics of a run directory
+
+    The store is written stage by stage: the candidate vocabulary (see TermRanker.export_all_candidates), the term
+    statistics (see write_term_statistics) and the C-values (see write_cvalues). Once the term statistics are
+    written, the store can be used as the ttf table of C-Value ranking (see ttf and sum_ttf) and as the subsumption
+    index of all candidates (see subsumption_index.SubsumptionIndex). Pickling a store (e.g., as pool initializer
+    argument) sends the run directory only, and the files are mapped again in the worker process.
+    """
+    CANDIDATES_FILE = 'candidates.vocab'
+    NORMED_TERMS_FILE = 'normed_terms.vocab'
+    NORMED_IDS_FILE = 'normed_ids.i64'
+    NORMED_CANDIDATES_FILE = 'normed_candidates.vocab'
+    TOKENS_FILE = 'tokens.vocab'
+    POSTINGS_FILE = 'postings.i64'
+    POSTING_OFFSETS_FILE = 'posting_offsets.i64'
+    CVALUES_FILE = 'cvalues.f64'
+    RANKING_FILE = 'ranking.i64'
+    INDEX_VERSION_FILE = 'index_version'
+
+    # number of records sorted in memory by external sort of term statistics
+    SPILL_CHUNK_SIZE = 1000000
+
+    STATISTICS_FILES = (NORMED_TERMS_FILE, NORMED_IDS_FILE, NORMED_CANDIDATES_FILE, TOKENS_FILE, POSTINGS_FILE,
+                        POSTING_OFFSETS_FILE)
+
+    def __init__(self, run_dir):
+        self._logger = logging.getLogger(__name__)
+        self.run_dir = run_dir
+        if not os.path.isdir(run_dir):
+            os.makedirs(run_dir)
+
+        self._vocabularies = {}
+        self._columns = {}
+        self.spill_chunk_size = self.SPILL_CHUNK_SIZE
+
+    def path(self, file_name):
+        return os.path.join(self.run_dir, file_name)
+
+    def _column(self, file_name, typecode):
+        column = self._columns.get(file_name)
+        if column is None:
+            column = _Column(self.path(file_name), typecode)
+            self._columns[file_name] = column
+        return column.values
+
+    def _write_column(self, file_name, typecode, values):
+        if not isinstance(values, array):
+            values = array(typecode, values)
+        with self._column_file(file_name) as column_file:
+            values.tofile(column_file)
+
+    @contextlib.contextmanager
+    def _column_file(self, file_name):
+        """
+        context of a temporary column file, which replaces the column if no error is raised
+        """
+        self._close_column(file_name)
+        tmp_path = self.path(file_name) + '.tmp'
+        try:
+            with open(tmp_path, 'w+b') as column_file:
+                yield column_file
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        os.replace(tmp_path, self.path(file_name))
+
+    @contextlib.contextmanager
+    def _scatter_column(self, file_name, typecode, length):
+        """
+        context of a writable memory mapped column of length zeros (e.g., written in random order)
+        """
+        with self._column_file(file_name) as column_file:
+            if length == 0:
+                # empty file cannot be mapped
+                yield array(typecode)
+                return
+            column_file.truncate(length * array(typecode).itemsize)
+            column_mmap = mmap.mmap(column_file.fileno(), 0)
+            values = memoryview(column_mmap).cast(typecode)
+            try:
+                yield values
+            finally:
+                values.release()
+                column_mmap.close()
+
+    def _close_column(self, file_name):
+        column = self._columns.pop(file_name, None)
+        if column is not None:
+            column.close()
+
+    def _vocabulary(self, file_name):
+        vocabulary = self._vocabularies.get(file_name)
+        if vocabulary is None:
+            vocabulary = VocabularyStore(self.path(file_name))
+            self._vocabularies[file_name] = vocabulary
+        return vocabulary
+
+    def _write_vocabulary(self, file_name, term_dfs):
+        self._close_vocabulary(file_name)
+        VocabularyStore.write(self.path(file_name), term_dfs)
+
+    def _close_vocabulary(self, file_name):
+        vocabulary = self._vocabularies.pop(file_name, None)
+        if vocabulary is not None:
+            vocabulary.close()
+
+    @property
+    def candidates(self):
+        """
+        return VocabularyStore, candidate terms and df
+        """
+        return self._vocabulary(self.CANDIDATES_FILE)
+
+    @property
+    def normed_terms(self):
+        """
+        return VocabularyStore, distinct normalised forms and ttf
+        """
+        return self._vocabulary(self.NORMED_TERMS_FILE)
+
+    @property
+    def normed_ids(self):
+        return self._column(self.NORMED_IDS_FILE, 'q')
+
+    @property
+    def normed_candidates(self):
+        """
+        return VocabularyStore, simply normalised forms of candidates (in candidate id order) and token counts
+        """
+        return self._vocabulary(self.NORMED_CANDIDATES_FILE)
+
+    @property
+    def token_counts(self):
+        return self.normed_candidates.df_column()
+
+    @property
+    def tokens(self):
+        """
+        return VocabularyStore, distinct tokens of simply normalised forms and length of their posting lists
+        """
+        return self._vocabulary(self.TOKENS_FILE)
+
+    @property
+    def postings(self):
+        return self._column(self.POSTINGS_FILE, 'q')
+
+    @property
+    def posting_offsets(self):
+        return self._column(self.POSTING_OFFSETS_FILE, 'q')
+
+    @property
+    def cvalues(self):
+        return self._column(self.CVALUES_FILE, 'd')
+
+    @property
+    def ranking(self):
+        return self._column(self.RANKING_FILE, 'q')
+
+    @property
+    def index_version(self):
+        """
+        return str, version of the Solr index the candidates are exported from, or None if it is unknown
+        """
+        if not os.path.exists(self.path(self.INDEX_VERSION_FILE)):
+            return None
+        with open(self.path(self.INDEX_VERSION_FILE)) as index_version_file:
+            return index_version_file.read().strip()
+
+    def has_candidates(self, index_version=None):
+        """
+        return True if the candidate vocabulary is written and, if index_version is given, exported from that version
+                of the Solr index
+        """
+        if not os.path.exists(self.path(self.CANDIDATES_FILE)):
+            return False
+        return index_version is None or self.index_version == str(index_version)
+
+    def has_term_statistics(self):
+        """
+        return True if the term statistics of the candidates are written (see write_term_statistics)
+        """
+        return all(os.path.exists(self.path(file_name)) for file_name in self.STATISTICS_FILES)
+
+    def write_candidates(self, term_dfs, index_version=None):
+        """
+        write the candidate vocabulary (replacing all the statistics of previous candidates)
+        params:
+            term_dfs, iterable of (candidate, df), e.g., SolrClient.scan_field_terms
+            index_version, optional, version of the Solr index the candidates are exported from
+        return VocabularyStore, candidate terms and df
+        """
+        self.close()
+        for file_name in (self.INDEX_VERSION_FILE,) + self.STATISTICS_FILES + (self.CVALUES_FILE, self.RANKING_FILE):
+            if os.path.exists(self.path(file_name)):
+                os.remove(self.path(file_name))
+        VocabularyStore.write(self.path(self.CANDIDATES_FILE), term_dfs)
+        if index_version is not None:
+            with open(self.path(self.INDEX_VERSION_FILE), 'w') as index_version_file:
+                index_version_file.write(str(index_version))
+        return self.candidates
+
+    def write_term_statistics(self, normalise, scan_ttf):
+        """
+        write normalised forms, ttf, simply normalised forms, token counts and token postings of all candidates
+
+        Candidates are streamed from the candidate vocabulary, and (normalised form, candidate id) and (token,
+        candidate id) records are sorted by external sort (see _SortedSpill) instead of being grouped in dictionaries.
+        Normalised forms are written in sorted order with their ttf as they are scanned (e.g., batch by batch from
+        Solr), and the normalised form ids are written straight into the mapped normed_ids column.
+        params:
+            normalise, function of candidate -> normalised form (e.g., SolrClient.get_ttf_normalised_term)
+            scan_ttf, function of iterable of distinct normalised forms -> iterable of (normalised form, ttf) in the
+                      same order, where ttf is None if unknown (e.g., SolrClient.scan_totaltermfreq)
+        """
+        normed_term_spill = _SortedSpill(self.run_dir, self.spill_chunk_size)
+        token_spill = _SortedSpill(self.run_dir, self.spill_chunk_size)
+
+        def normed_candidates():
+            for candidate_id, candidate in enumerate(self.candidates):
+                normed_term_spill.add(normalise(candidate), candidate_id)
+
+                normed_candidate = TermUtil.normalise(candidate)
+                tokens = normed_candidate.split(' ')
+                for token in set(tokens):
+                    token_spill.add(token, candidate_id)
+                yield normed_candidate, len(tokens)
+
+        try:
+            self._write_vocabulary(self.NORMED_CANDIDATES_FILE, normed_candidates())
+
+            with self._scatter_column(self.NORMED_IDS_FILE, 'q', len(self.candidates)) as normed_ids:
+                def normed_terms():
+                    # normalised form ids are assigned in sorted order of normalised forms
+                    for normed_term_id, (normed_term, records) in enumerate(
+                            itertools.groupby(normed_term_spill, key=operator.itemgetter(0))):
+                        for record in records:
+                            normed_ids[record[1]] = normed_term_id
+                        yield normed_term
+
+                self._write_vocabulary(self.NORMED_TERMS_FILE,
+                                       ((normed_term, ttf or 0) for normed_term, ttf in scan_ttf(normed_terms())))
+
+            self._write_postings(token_spill)
+        finally:
+            normed_term_spill.close()
+            token_spill.close()
+
+    def _write_postings(self, token_postings):
+        """
+        write tokens, posting lists and posting offsets from (token, candidate id) records sorted by token and
+        candidate id, one posting list in memory at a time
+        """
+        with self._column_file(self.POSTINGS_FILE) as postings_file, \
+                self._column_file(self.POSTING_OFFSETS_FILE) as posting_offsets_file:
+            def token_counts():
+                num_postings = 0
+                array('q', [num_postings]).tofile(posting_offsets_file)
+                for token, records in itertools.groupby(token_postings, key=operator.itemgetter(0)):
+                    postings = array('q', (record[1] for record in records))
+                    postings.tofile(postings_file)
+                    num_postings += len(postings)
+                    array('q', [num_postings]).tofile(posting_offsets_file)
+                    yield token, len(postings)
+
+            # posting lists in token order, so that tokens are looked up by binary search
+            self._write_vocabulary(self.TOKENS_FILE, token_counts())
+
+    def write_cvalues(self, cvalues):
+        """
+        write C-value of every candidate (in candidate id order) and the ranking by C-value
+        """
+        cvalues = array('d', cvalues)
+        # stable sort keeps candidate order among equal C-values
+        ranking = array('q', sorted(range(len(cvalues)), key=cvalues.__getitem__, reverse=True))
+        self._write_column(self.CVALUES_FILE, 'd', cvalues)
+        self._write_column(self.RANKING_FILE, 'q', ranking)
+
+    def __len__(self):
+        return len(self.candidates)
+
+    def __contains__(self, term):
+        return term in self.candidates
+
+    def candidate_id(self, term):
+        """
+        return int, candidate id (position in candidate vocabulary) of a candidate
+        raise KeyError if the term is not a candidate
+        """
+        position = self.candidates.position(term)
+        if position < 0:
+            raise KeyError(term)
+        return position
+
+    def ttf(self, term):
+        """
+        return int, ttf of the normalised form of a candidate
+        raise KeyError if the term is not a candidate
+        """
+        return self.normed_terms.df(self.normed_ids[self.candidate_id(term)])
+
+    def sum_ttf(self, terms):
+        """
+        sum of ttf of candidates, counting every normalised form once
+        raise KeyError if any term is not a candidate
+        """
+        normed_ids = self.normed_ids
+        return sum(self.normed_terms.df(normed_id) for normed_id in
+                   set(normed_ids[self.candidate_id(term)] for term in terms))
+
+    def total_ttf(self):
+        """
+        return int, sum of ttf of all candidates, counting every normalised form once
+        """
+        return sum(self.normed_terms.df_column())
+
+    def ranked_candidates(self):
+        """
+        return RankedCandidates, (candidate, C-value) in descending order of C-value
+        """
+        return RankedCandidates(self)
+
+    def close(self):
+        for file_name in list(self._columns):
+            self._close_column(file_name)
+        for file_name in list(self._vocabularies):
+            self._close_vocabulary(file_name)
+
+    def __getstate__(self):
+        return {'run_dir': self.run_dir}
+
+    def __setstate__(self, state):
+        self.__init__(state['run_dir'])
+
+
+class RankedCandidates(object):
+    """
+    Sequence of (candidate, C-value) in descending order of C-value, read from a CandidateStore
+    """
+
+    def __init__(self, candidate_store):
+        self.candidate_store = candidate_store
+
+    def __len__(self):
+        return len(self.candidate_store.ranking)
+
+    def __getitem__(self, rank):
+        candidate_id = self.candidate_store.ranking[rank]
+        return self.candidate_store.candidates.term(candidate_id), self.candidate_store.cvalues[candidate_id]
+
+    def __iter__(self):
+        candidates = self.candidate_store.candidates
+        cvalues = self.candidate_store.cvalues
+        for candidate_id in self.candidate_store.ranking:
+            yield candidates.term(candidate_id), cvalues[candidate_id]
+
+
+def test_candidate_store():
+    import pickle
+    import shutil
+    import tempfile
+    run_dir = os.path.join(tempfile.gettempdir(), 'test_candidate_store')
+
+    store = CandidateStore(run_dir)
+    store.write_candidates([('rail steel', 2), ('steel', 5), ('steels', 1)], index_version=42)
+    print(store.has_candidates(42), store.has_candidates(43))
+    # external sort of 2 records per run
+    store.spill_chunk_size = 2
+    normed_terms_dict = {'rail steel': 'rail steel', 'steel': 'steel', 'steels': 'steel'}
+    ttf_dict = {'rail steel': 3, 'steel': 9}
+    store.write_term_statistics(normed_terms_dict.get, lambda normed_terms: ((normed_term, ttf_dict.get(normed_term))
+                                                                             for normed_term in normed_terms))
+    print(store.ttf('steels'), store.sum_ttf(['steel', 'steels', 'rail steel']), store.total_ttf(),
+          list(store.token_counts))
+    print(list(store.tokens.items()), list(store.postings))
+    try:
+        store.sum_ttf(['steel', 'slab'])
+    except KeyError as error:
+        print("unknown candidate:", error)
+
+    store.write_cvalues([3.0, 7.5, 7.5])
+    print(list(store.ranked_candidates()))
+    print(list(pickle.loads(pickle.dumps(store)).ranked_candidates()))
+    store.close()
+    shutil.rmtree(run_dir)
+
+
+if __name__ == '__main__':
+    test_candidate_store()
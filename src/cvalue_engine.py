@@ -0,0 +1,101 @@
+"""
+Vectorised C-Value engine
+
+Once the total term frequencies and the subsumption (nested term) relation of all candidates are known, C-Value is
+pure arithmetic and can be computed for all candidates in one pass over NumPy arrays and a SciPy sparse matrix:
+
+    C-value(a) = log2(|a|) * f(a),                              if a is not nested
+    C-value(a) = log2(|a|) * (f(a) - 1/P(Ta) * sum_{b in Ta} f(b)), otherwise
+
+Frantzi, K., Ananiadou, S., & Mima, H. (2000). Automatic recognition of multi-word terms:. the C-value/NC-value method.
+
+NumPy and SciPy are required.
+"""
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import math
+
+
+def batch_cvalue(term_lengths, term_freqs, nested_matrix, nested_freqs, longer_term_counts):
+    """
+    compute C-Value of all candidates in one vectorised pass
+
+    params:
+        term_lengths, int array (n_candidates), number of words |a| of every candidate
+        term_freqs, int array (n_candidates), total term frequency f(a) of every candidate
+        nested_matrix, sparse 0/1 matrix (n_candidates x n_terms), is-nested-in relation where [a, b] = 1 if
+                        term b is a longer term containing candidate a
+        nested_freqs, int array (n_terms), total term frequency f(b) of the columns of nested_matrix
+        longer_term_counts, int array (n_candidates), number of longer candidates P(Ta)
+    return float array (n_candidates), C-Value of every candidate
+    """
+    import numpy as np
+
+    term_lengths = np.asarray(term_lengths, dtype=np.int64)
+    term_freqs = np.asarray(term_freqs, dtype=np.int64)
+    nested_freqs = np.asarray(nested_freqs, dtype=np.int64)
+    longer_term_counts = np.asarray(longer_term_counts, dtype=np.int64)
+
+    # log2(|a|) by lookup of math.log(|a|, 2) to keep the same floating point results as the per-term calculation
+    max_length = int(term_lengths.max()) if len(term_lengths) else 0
+    log2_table = np.array([0.0] + [math.log(length, 2) for length in range(1, max_length + 1)])
+    log2a = log2_table[term_lengths]
+
+    # integer sums of f(b) are exact
+    sum_fb = np.asarray(nested_matrix.dot(nested_freqs)).ravel()
+
+    nested = longer_term_counts > 0
+    penalty = np.zeros(len(term_freqs), dtype=np.float64)
+    penalty[nested] = (1 / longer_term_counts[nested]) * sum_fb[nested]
+
+    return log2a * (term_freqs - penalty)
+
+
+def build_store_cvalue_inputs(subsumption_index, candidate_store):
+    """
+    build the input arrays of batch_cvalue from a SubsumptionIndex and a CandidateStore of all candidates
+
+    The columns of the is-nested-in matrix are the distinct normalised forms of longer terms, because the total
+    frequency of longer terms sharing the same normalised form is counted once (see CandidateStore.sum_ttf). Token
+    counts, normalised form ids and ttf are read from the memory mapped columns of the store without copying.
+
+    return tuple (term_lengths, term_freqs, nested_matrix, nested_freqs, longer_term_counts)
+    """
+    import numpy as np
+
+    term_lengths = np.frombuffer(candidate_store.token_counts, dtype=np.int64)
+    candidate_normed_ids = np.frombuffer(candidate_store.normed_ids, dtype=np.int64)
+    nested_freqs = np.frombuffer(candidate_store.normed_terms.df_column(), dtype=np.int64)
+    term_freqs = nested_freqs[candidate_normed_ids]
+
+    nested_matrix, longer_term_counts = build_nested_matrix(subsumption_index, candidate_normed_ids,
+                                                            len(nested_freqs))
+    return term_lengths, term_freqs, nested_matrix, nested_freqs, longer_term_counts
+
+
+def build_nested_matrix(subsumption_index, candidate_normed_ids, num_normed_terms):
+    """
+    return tuple (nested_matrix, longer_term_counts), is-nested-in matrix over the normalised form ids of longer terms
+            and number of longer candidates of every candidate
+    """
+    import numpy as np
+    from scipy.sparse import csr_matrix
+
+    num_candidates = len(subsumption_index)
+
+    indptr = [0]
+    indices = []
+    longer_term_counts = np.zeros(num_candidates, dtype=np.int64)
+    for candidate_id in range(num_candidates):
+        longer_term_ids = subsumption_index.candidate_longer_term_ids(candidate_id)
+        longer_term_counts[candidate_id] = len(longer_term_ids)
+        columns = sorted(set(candidate_normed_ids[longer_term_ids].tolist()))
+        indices.extend(columns)
+        indptr.append(len(indices))
+
+    nested_matrix = csr_matrix((np.ones(len(indices), dtype=np.int64), np.array(indices, dtype=np.int64),
+                                np.array(indptr, dtype=np.int64)), shape=(num_candidates, num_normed_terms))
+
+    return nested_matrix, longer_term_counts
@@ -0,0 +1,110 @@
+"""
+Exact dictionary tagger over normalised dictionary terms
+"""
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from collections import deque
+
+
+class ExactDictionaryTagger(object):
+    """
+    Exact matching of normalised dictionary terms, built once per dictionary.
+
+    Two ways of tagging are supported:
+        1) tag_terms(): term vector keys (i.e., normalised terms indexed in a document) are looked up in a hash set;
+        2) tag_tokens()/tag_text(): normalised document tokens are scanned by a token-level Aho-Corasick automaton,
+            which finds all the dictionary terms occurring in the text in one linear pass.
+    """
+
+    def __init__(self, dict_terms):
+        """
+        params:
+            dict_terms, normalised dictionary terms (tokens separated by whitespace)
+        """
+        self.term_set = frozenset(filter(None, dict_terms))
+
+        # automaton states: goto transitions (token -> state), failure link and matched terms of every state
+        self._goto = [{}]
+        self._fail = [0]
+        self._output = [()]
+        for term in self.term_set:
+            state = 0
+            for token in term.split():
+                next_state = self._goto[state].get(token)
+                if next_state is None:
+                    next_state = len(self._goto)
+                    self._goto[state][token] = next_state
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append(())
+                state = next_state
+            self._output[state] = (term,)
+
+        # failure links by breadth first traversal
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for token, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail_state = self._fail[state]
+                while fail_state and token not in self._goto[fail_state]:
+                    fail_state = self._fail[fail_state]
+                self._fail[next_state] = self._goto[fail_state].get(token, 0)
+                if self._output[self._fail[next_state]]:
+                    self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def __len__(self):
+        return len(self.term_set)
+
+    def __contains__(self, term):
+        return term in self.term_set
+
+    def tag_terms(self, indexed_terms):
+        """
+        params:
+            indexed_terms, normalised terms (e.g., term vector keys of a document)
+        return set, dictionary terms in indexed terms
+        """
+        return self.term_set.intersection(indexed_terms)
+
+    def tag_tokens(self, tokens):
+        """
+        params:
+            tokens, normalised token sequence of a document
+        return set, dictionary terms occurring as contiguous token sequence
+        """
+        goto, fail, output = self._goto, self._fail, self._output
+        tagged_terms = set()
+        state = 0
+        for token in tokens:
+            while state and token not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(token, 0)
+            if output[state]:
+                tagged_terms.update(output[state])
+        return tagged_terms
+
+    def tag_text(self, text, normaliser):
+        """
+        params:
+            text, document content
+            normaliser, term normaliser giving the normalised tokens of text (e.g., LocalTermNormaliser)
+        return set, dictionary terms occurring in text
+        """
+        return self.tag_tokens(normaliser.tokens(text))
+
+
+def test_exact_dictionary_tagger():
+    from term_normaliser import LocalTermNormaliser
+    normaliser = LocalTermNormaliser()
+    dict_terms = [normaliser.normalise(term) for term in ["steel", "rail steel", "longitudinal S prints",
+                                                          "S print", "final US rate", "rate"]]
+    tagger = ExactDictionaryTagger(dict_terms)
+    print(tagger.tag_terms(["rail steel", "steel", "bloom"]))
+    print(tagger.tag_text("Longitudinal S prints of rail steels with a final US rate of 0.8%", normaliser))
+
+
+if __name__ == '__main__':
+    test_exact_dictionary_tagger()
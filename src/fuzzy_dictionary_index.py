@@ -0,0 +1,286 @@
+"""
+Fuzzy dictionary indexes for dictionary tagging with a normalised Levenshtein similarity threshold
+
+    'trie', CompactTrie search within Levenshtein distance 3 re-scored by similarity (the original fuzzy matching)
+    'symspell', symmetric delete index (SymSpell, Wolf Garbe)
+    'bktree', Burkhard-Keller tree over Levenshtein distance
+
+Normalised Levenshtein similarity of terms a and b is 1 - d(a, b) / max(|a|, |b|) (see levenshtein_similarity).
+Every dictionary term b with similarity no less than threshold t to a term a of length n satisfies
+d <= (1 - t) * max(n, |b|) <= (1 - t) * (n + d), i.e., d <= floor((1 - t) * n / t). The bound (capped at distance 3
+as the trie search) is applied directly by the SymSpell and BK-tree lookups, which then return the same matches as
+the trie.
+"""
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import math
+import time
+
+from trie_dictionary_tagger import CompactTrie
+from trie_dictionary_tagger import levenshtein_similarity
+
+# Levenshtein distance of the trie search
+MAX_EDIT_DISTANCE = 3
+
+
+def levenshtein_distance(str1, str2, max_distance=None):
+    """
+    return int, Levenshtein distance, or max_distance + 1 if the distance is larger than max_distance
+    """
+    if len(str1) < len(str2):
+        str1, str2 = str2, str1
+    if max_distance is not None and len(str1) - len(str2) > max_distance:
+        return max_distance + 1
+
+    previous_row = list(range(len(str2) + 1))
+    for i, char1 in enumerate(str1, 1):
+        current_row = [i]
+        for j, char2 in enumerate(str2, 1):
+            current_row.append(min(current_row[j - 1] + 1, previous_row[j] + 1,
+                                   previous_row[j - 1] + (char1 != char2)))
+        if max_distance is not None and min(current_row) > max_distance:
+            return max_distance + 1
+        previous_row = current_row
+    return previous_row[-1]
+
+
+def max_distance_for_similarity(term_length, threshold, cap=MAX_EDIT_DISTANCE):
+    """
+    return int, maximum Levenshtein distance of any term with normalised similarity no less than threshold
+    """
+    if threshold <= 0:
+        return cap
+    # small epsilon against floating point error, e.g., (1 - 0.9) * 9 / 0.9
+    return max(0, min(cap, int(math.floor((1 - threshold) * term_length / threshold + 1e-9))))
+
+
+def normalised_similarity(str1, str2, distance):
+    longest = max(len(str1), len(str2))
+    return 1 - distance / longest if longest else 1.0
+
+
+class FuzzyDictionaryIndex(object):
+    """
+    base class of fuzzy dictionary indexes
+    """
+
+    def __init__(self, dict_terms):
+        self.dict_terms = sorted(set(filter(None, dict_terms)))
+        # number of distance computations of lookups (see benchmark_fuzzy_dictionary_indexes): dictionary terms
+        # verified by SymSpell and BK-tree, trie nodes visited (one Levenshtein row each) by trie search
+        self.verified_candidates = 0
+
+    def __len__(self):
+        return len(self.dict_terms)
+
+    def lookup(self, term, threshold):
+        """
+        return list, (dictionary term, similarity) of dictionary terms with normalised Levenshtein similarity no less
+                than threshold
+        """
+        raise NotImplementedError("Should have implemented this method!")
+
+
+class TrieFuzzyIndex(FuzzyDictionaryIndex):
+    """
+    CompactTrie search within Levenshtein distance 3 and similarity re-scoring
+    """
+
+    def __init__(self, dict_terms):
+        super(TrieFuzzyIndex, self).__init__(dict_terms)
+        self.trie = CompactTrie(self.dict_terms)
+
+    def lookup(self, term, threshold):
+        visited_nodes = self.trie.visited_nodes
+        similar_terms = self.trie.search(term, MAX_EDIT_DISTANCE)
+        self.verified_candidates += self.trie.visited_nodes - visited_nodes
+        return [(similar_term, similarity) for similar_term, similarity in
+                ((similar_term[0], levenshtein_similarity(term, similar_term[0])) for similar_term in similar_terms)
+                if similarity >= threshold]
+
+
+class SymSpellIndex(FuzzyDictionaryIndex):
+    """
+    Symmetric delete index: every term is indexed by all the strings given by deleting up to max_distance characters.
+    Terms within distance d of a query share at least one delete of the query within d deletions.
+
+    A term of length m has about C(m, d) deletes within d deletions, which makes the index much larger than the
+    dictionary for long multi-word terms. If the index is built for a similarity threshold t, every term is indexed
+    within its own distance bound floor((1 - t) * m / t) (see max_distance_for_similarity) only, which is enough for
+    lookups with threshold no less than t because a matching term within distance d of a query satisfies the bound
+    of both lengths.
+    """
+
+    def __init__(self, dict_terms, threshold=None, max_distance=MAX_EDIT_DISTANCE):
+        """
+        params:
+            dict_terms, dictionary terms
+            threshold, optional, minimum similarity threshold of lookups, index every term within max_distance if None
+            max_distance, maximum Levenshtein distance of the index
+        """
+        super(SymSpellIndex, self).__init__(dict_terms)
+        self.threshold = threshold
+        self.max_distance = max_distance
+
+        self.deletes = {}
+        for term_id, dict_term in enumerate(self.dict_terms):
+            term_max_distance = max_distance if threshold is None else \
+                min(max_distance, max_distance_for_similarity(len(dict_term), threshold))
+            for deleted in self._deletes(dict_term, term_max_distance):
+                self.deletes.setdefault(deleted, []).append(term_id)
+
+    @staticmethod
+    def _deletes(term, max_distance):
+        """
+        return set, the term and all the strings given by deleting up to max_distance characters
+        """
+        deletes = {term}
+        current = {term}
+        for distance in range(max_distance):
+            current = set(candidate[:i] + candidate[i + 1:] for candidate in current for i in range(len(candidate)))
+            deletes.update(current)
+        return deletes
+
+    def lookup(self, term, threshold):
+        if self.threshold is not None and threshold < self.threshold:
+            raise Exception("SymSpell index built for similarity threshold [%s] cannot look up with threshold [%s]!"
+                            % (self.threshold, threshold))
+        max_distance = min(self.max_distance, max_distance_for_similarity(len(term), threshold))
+
+        candidate_ids = set()
+        for deleted in self._deletes(term, max_distance):
+            candidate_ids.update(self.deletes.get(deleted, ()))
+
+        results = []
+        for term_id in candidate_ids:
+            dict_term = self.dict_terms[term_id]
+            if abs(len(dict_term) - len(term)) > max_distance:
+                continue
+            self.verified_candidates += 1
+            distance = levenshtein_distance(term, dict_term, max_distance)
+            if distance <= max_distance:
+                similarity = normalised_similarity(term, dict_term, distance)
+                if similarity >= threshold:
+                    results.append((dict_term, similarity))
+        return results
+
+
+class BKTreeIndex(FuzzyDictionaryIndex):
+    """
+    Burkhard-Keller tree: children of a node are keyed by their Levenshtein distance to the node, so that a query
+    within distance d only visits children keyed in [distance - d, distance + d] (triangle inequality).
+    """
+
+    def __init__(self, dict_terms):
+        super(BKTreeIndex, self).__init__(dict_terms)
+        # node: [term, {distance: child node}]
+        self.root = None
+        for dict_term in self.dict_terms:
+            self._insert(dict_term)
+
+    def _insert(self, dict_term):
+        if self.root is None:
+            self.root = [dict_term, {}]
+            return
+        node = self.root
+        while True:
+            distance = levenshtein_distance(dict_term, node[0])
+            child = node[1].get(distance)
+            if child is None:
+                node[1][distance] = [dict_term, {}]
+                return
+            node = child
+
+    def lookup(self, term, threshold):
+        if self.root is None:
+            return []
+        max_distance = max_distance_for_similarity(len(term), threshold)
+
+        results = []
+        stack = [self.root]
+        while stack:
+            dict_term, children = stack.pop()
+            self.verified_candidates += 1
+            distance = levenshtein_distance(term, dict_term)
+            if distance <= max_distance:
+                similarity = normalised_similarity(term, dict_term, distance)
+                if similarity >= threshold:
+                    results.append((dict_term, similarity))
+            stack.extend(child for child_distance, child in children.items()
+                         if distance - max_distance <= child_distance <= distance + max_distance)
+        return results
+
+
+FUZZY_DICTIONARY_INDEXES = {'trie': TrieFuzzyIndex, 'symspell': SymSpellIndex, 'bktree': BKTreeIndex}
+
+
+def build_fuzzy_dictionary_index(index_type, dict_terms, threshold=None):
+    """
+    params:
+        index_type, 'trie', 'symspell' or 'bktree'
+        dict_terms, dictionary terms
+        threshold, optional, minimum similarity threshold of lookups, which bounds the size of SymSpell index
+    return FuzzyDictionaryIndex, index of the type over dictionary terms
+    """
+    if index_type not in FUZZY_DICTIONARY_INDEXES:
+        raise Exception("current setting [%s] for 'dict_tagger_fuzzy_index' is not supported!" % index_type)
+    if index_type == 'symspell':
+        return SymSpellIndex(dict_terms, threshold=threshold)
+    return FUZZY_DICTIONARY_INDEXES[index_type](dict_terms)
+
+
+def benchmark_fuzzy_dictionary_indexes(dict_terms, queries, threshold):
+    """
+    compare build time, lookup latency, verified candidates (trie nodes visited for 'trie', see
+    FuzzyDictionaryIndex) and matches of every fuzzy index type
+
+    return dict, statistics per index type
+    """
+    stats = {}
+    matches = {}
+    for index_type in sorted(FUZZY_DICTIONARY_INDEXES):
+        start = time.time()
+        fuzzy_index = build_fuzzy_dictionary_index(index_type, dict_terms, threshold)
+        build_time = time.time() - start
+
+        start = time.time()
+        matches[index_type] = [sorted(dict_term for dict_term, similarity in fuzzy_index.lookup(query, threshold))
+                               for query in queries]
+        lookup_time = time.time() - start
+
+        stats[index_type] = {'build_seconds': build_time,
+                             'lookup_ms_per_term': 1000 * lookup_time / len(queries) if queries else 0.0,
+                             'verified_candidates_per_term':
+                                 fuzzy_index.verified_candidates / len(queries) if queries else 0.0,
+                             'matches': sum(len(query_matches) for query_matches in matches[index_type])}
+    for index_type in stats:
+        stats[index_type]['consistent_with_trie'] = matches[index_type] == matches['trie']
+    return stats
+
+
+def test_benchmark_fuzzy_dictionary_indexes():
+    import random
+    from FileUtil import load_terms_from_csv
+    dict_terms = [term.lower() for term in load_terms_from_csv(
+        os.path.join(os.path.dirname(__file__), '..', 'config', 'Steel-Terminology-Tata-Steel.csv'))]
+
+    # dictionary terms with random typos
+    letters = 'abcdefghijklmnopqrstuvwxyz '
+    queries = []
+    for dict_term in random.sample(dict_terms, min(100, len(dict_terms))):
+        chars = list(dict_term)
+        for i in range(random.randint(0, 2)):
+            chars[random.randrange(len(chars))] = random.choice(letters)
+        queries.append(''.join(chars))
+
+    for threshold in (0.86, 0.95):
+        print("threshold [%s]:" % threshold)
+        for index_type, index_stats in sorted(benchmark_fuzzy_dictionary_indexes(dict_terms, queries,
+                                                                                 threshold).items()):
+            print("  %s: %s" % (index_type, index_stats))
+
+
+if __name__ == '__main__':
+    test_benchmark_fuzzy_dictionary_indexes()
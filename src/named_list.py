@@ -0,0 +1,140 @@
+"""
+Decoding of Solr NamedList structures (term vectors, terms component, field analysis, ...) in responses
+
+NamedList is written in json responses as requested by 'json.nl':
+    'flat' (default), [name1, value1, name2, value2, ...]
+    'map', {name1: value1, name2: value2, ...}, which loses repeated names (e.g., term positions and offsets)
+    'arrarr', [[name1, value1], [name2, value2], ...]
+
+Requests ask Solr for 'map' where names are unique (see SolrClient). The decoders below accept all the three forms
+and read every (name, value) pair once, without intermediate key/value lists.
+"""
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import itertools
+
+# term vector containers of repeated entries, decoded as list of dict (one dict per position/offset)
+REPEATED_RECORD_CONTAINERS = {'positions': 'position', 'offsets': 'start'}
+
+
+def iter_named_list(named_list):
+    """
+    return iterator of (name, value) pairs of a NamedList in 'flat', 'map' or 'arrarr' form
+    """
+    if isinstance(named_list, dict):
+        return iter(named_list.items())
+    if named_list and isinstance(named_list[0], list):
+        # 'arrarr', names of 'flat' NamedList are strings
+        return ((pair[0], pair[1]) for pair in named_list)
+    flat = iter(named_list)
+    return zip(flat, flat)
+
+
+def named_list_to_dict(named_list):
+    """
+    decode the top level of a NamedList
+    return dict, name -> value (NamedList values are not decoded)
+    """
+    if isinstance(named_list, dict):
+        return named_list
+    return dict(iter_named_list(named_list))
+
+
+def named_list_names(named_list):
+    """
+    return iterator of the names of a NamedList, e.g., the terms of a term vector without their statistics
+    """
+    if isinstance(named_list, dict):
+        return iter(named_list)
+    if named_list and isinstance(named_list[0], list):
+        return (pair[0] for pair in named_list)
+    return iter(named_list[0::2])
+
+
+def decode_named_list(named_list, container_name=None):
+    """
+    nested decoding of a NamedList: NamedList values are decoded recursively.
+    The repeated 'position' or 'start'/'end' entries of term vector 'positions' and 'offsets' are decoded as list of
+    dict, one dict per position or offset. Other NamedLists (e.g., terms of a term vector, which can be any name,
+    including a term named 'positions' whose statistics start with 'tf') are decoded as dict.
+
+    params:
+        named_list, NamedList in any 'json.nl' form
+        container_name, name of the NamedList in its parent
+    return dict, or list of dict for positions and offsets
+    """
+    pairs = iter_named_list(named_list)
+    first_pair = next(pairs, None)
+    if first_pair is None:
+        return {}
+
+    if container_name in REPEATED_RECORD_CONTAINERS and first_pair[0] == REPEATED_RECORD_CONTAINERS[container_name]:
+        records = [{first_pair[0]: first_pair[1]}]
+        for name, value in pairs:
+            if name in records[-1]:
+                records.append({})
+            records[-1][name] = value
+        return records
+
+    decoded = {}
+    for name, value in itertools.chain([first_pair], pairs):
+        if isinstance(value, (list, dict)):
+            value = decode_named_list(value, name)
+        decoded[name] = value
+    return decoded
+
+
+def iter_terms_xml(stream, field):
+    """
+    stream the terms of a field from a /terms response in xml (wt=xml), e.g.,
+        <response><lst name="terms"><lst name="content"><int name="steel">12</int>...</lst></lst></response>
+
+    Elements are parsed incrementally and discarded once read, so memory does not grow with the number of terms.
+    params:
+        stream, file-like object of the response body
+        field, field name of terms
+    return generator of (term, document frequency)
+    """
+    from xml.etree.ElementTree import iterparse
+
+    # names of the open 'lst' elements
+    path = []
+    field_list = None
+    for event, elem in iterparse(stream, events=('start', 'end')):
+        if event == 'start':
+            if elem.tag == 'lst':
+                path.append(elem.get('name'))
+                if path == ['terms', field]:
+                    field_list = elem
+            continue
+
+        if elem.tag == 'lst':
+            path.pop()
+        elif field_list is not None and path == ['terms', field]:
+            yield elem.get('name'), int(elem.text)
+            # discard terms already read
+            field_list.clear()
+
+
+def test_decode_named_list():
+    import io
+    term_vectors = ['uniqueKeyFieldName', 'id',
+                    'doc1', ['uniqueKey', 'doc1',
+                             'content', ['steel', ['tf', 2, 'positions', ['position', 0, 'position', 5],
+                                                   'offsets', ['start', 0, 'end', 5, 'start', 30, 'end', 35]]]]]
+    print(decode_named_list(term_vectors))
+    print(decode_named_list([['steel', [['tf', 2]]]]))
+    # terms named as positions/offsets entries are decoded as terms
+    print(decode_named_list(['end', ['tf', 1], 'position', ['tf', 3], 'offsets', ['tf', 2, 'df', 4]]))
+    print(list(named_list_names(['steel', [], 'rail', []])))
+
+    terms_xml = b'<?xml version="1.0" encoding="UTF-8"?><response><lst name="responseHeader"><int name="status">0</int>' \
+                b'</lst><lst name="terms"><lst name="content"><int name="rail">3</int><long name="steel">12</long>' \
+                b'</lst></lst></response>'
+    print(list(iter_terms_xml(io.BytesIO(terms_xml), 'content')))
+
+
+if __name__ == '__main__':
+    test_decode_named_list()
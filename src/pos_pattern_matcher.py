@@ -0,0 +1,152 @@
+"""
+Finite-state matcher of POS sequence patterns (see config/pos_sequence_filter*) over integer tag ids
+"""
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import re
+
+# Penn Treebank tags (as tagged by nltk.pos_tag). Other tags are given an id on first occurrence.
+PENN_TREEBANK_TAGS = ['CC', 'CD', 'DT', 'EX', 'FW', 'IN', 'JJ', 'JJR', 'JJS', 'LS', 'MD', 'NN', 'NNS', 'NNP', 'NNPS',
+                      'PDT', 'POS', 'PRP', 'PRP$', 'RB', 'RBR', 'RBS', 'RP', 'SYM', 'TO', 'UH', 'VB', 'VBD', 'VBG',
+                      'VBN', 'VBP', 'VBZ', 'WDT', 'WP', 'WP$', 'WRB', '$', '#', '``', "''", '(', ')', ',', '.', ':',
+                      '-NONE-']
+
+# tag id i is encoded as character chr(TAG_CHAR_BASE + i) (Unicode private use area)
+TAG_CHAR_BASE = 0xE000
+
+# tag (i.e., <...>) in tag pattern
+_TAG = re.compile(r'<([^<>]*)>')
+# unescaped capturing group, rewritten to non-capturing group
+_CAPTURING_GROUP = re.compile(r'(?<!\\)\((?!\?)')
+
+
+class PosPatternMatcher(object):
+    """
+    Matcher of a set of nltk style tag patterns (e.g., '<VBG>? <JJ>* <NN|NNP|NNS>+') over tagged tokens
+
+    Every tag is mapped to an integer id and a tagged sentence is encoded as a string of one character per tag, so
+    that '<NN|NNP|NNS>' is a character class of the tag ids it matches. All the patterns are compiled into a single
+    automaton (a regular expression of one optional lookahead per pattern) which is run once at every token position
+    and gives the matches of every pattern at that position.
+
+    The spans are the same as chunking the sentence by a separate nltk.RegexpParser per pattern, i.e., every pattern
+    takes the leftmost match from left to right and resumes after its end. Empty matches of patterns that can match
+    an empty tag sequence (e.g., '<JJ>*') are ignored (RegexpParser gives an empty chunk for them).
+    """
+    # capture groups per automaton (Python 3.4 're' supports up to 100 groups)
+    MAX_PATTERNS_PER_AUTOMATON = 90
+
+    def __init__(self, tag_patterns, tags=PENN_TREEBANK_TAGS):
+        """
+        params:
+            tag_patterns, list of nltk style tag patterns
+            tags, known tags, to which ids are given in advance
+        """
+        self.tag_patterns = list(tag_patterns)
+        # tags of every pattern -> regular expressions over tag strings, e.g., '<NN.*>' -> '(?:NN[^{}<>]*)\Z'
+        self._tag_regexps = [[re.compile(r'(?:%s)\Z' % tag_regexp.replace('.', r'[^{}<>]')) for tag_regexp in
+                              _TAG.findall(re.sub(r'\s', '', tag_pattern))] for tag_pattern in self.tag_patterns]
+
+        self.tag_ids = {}
+        self._tag_chars = {}
+        for tag in tags:
+            self._add_tag(tag)
+        self._compile()
+
+    def __len__(self):
+        return len(self.tag_patterns)
+
+    def _add_tag(self, tag):
+        tag_char = chr(TAG_CHAR_BASE + len(self.tag_ids))
+        self.tag_ids[tag] = len(self.tag_ids)
+        self._tag_chars[tag] = tag_char
+        return tag_char
+
+    def _tag_class(self, tag_regexp):
+        """
+        return string, character class of the ids of all known tags fully matching the tag regular expression
+        """
+        tag_chars = [tag_char for tag, tag_char in self._tag_chars.items() if tag_regexp.match(tag)]
+        return '[%s]' % ''.join(tag_chars) if tag_chars else '(?!)'
+
+    def _compile(self):
+        self.automata = []
+        num_patterns = len(self.tag_patterns)
+        for offset in range(0, num_patterns, self.MAX_PATTERNS_PER_AUTOMATON):
+            group_patterns = []
+            for pattern_id in range(offset, min(offset + self.MAX_PATTERNS_PER_AUTOMATON, num_patterns)):
+                tag_classes = iter([self._tag_class(tag_regexp) for tag_regexp in self._tag_regexps[pattern_id]])
+                re_pattern = _CAPTURING_GROUP.sub('(?:', re.sub(r'\s', '', self.tag_patterns[pattern_id]))
+                re_pattern = _TAG.sub(lambda tag: next(tag_classes), re_pattern)
+                group_patterns.append('(?:(?=(?P<p%d>%s)))?' % (pattern_id, re_pattern))
+
+            self.automata.append((re.compile(''.join(group_patterns)), len(group_patterns)))
+
+    def encode(self, tags):
+        """
+        return string, one character per tag id
+        """
+        tag_chars = self._tag_chars
+        encoded = []
+        for tag in tags:
+            tag_char = tag_chars.get(tag)
+            if tag_char is None:
+                tag_char = self._add_tag(tag)
+                self._compile()
+            encoded.append(tag_char)
+        return ''.join(encoded)
+
+    def spans(self, tags):
+        """
+        params:
+            tags, POS tag sequence of a sentence
+        return list, (start, end) token spans matched by every pattern. The same span can be matched by more than
+                one pattern.
+        """
+        encoded = self.encode(tags)
+        length = len(encoded)
+
+        spans = []
+        for automaton, num_patterns in self.automata:
+            # position from which every pattern resumes its left-to-right scan
+            resume_positions = [0] * num_patterns
+            for position in range(length):
+                matches = automaton.match(encoded, position)
+                for group_id in range(num_patterns):
+                    if position < resume_positions[group_id]:
+                        continue
+                    end = matches.end(group_id + 1)
+                    if end > position:
+                        spans.append((position, end))
+                        resume_positions[group_id] = end
+        return spans
+
+    def match(self, tagged_tokens):
+        """
+        params:
+            tagged_tokens, (token, tag) sequence of a sentence
+        return list, matched (token, tag) sequences
+        """
+        return [tagged_tokens[start:end] for start, end in self.spans([tag for token, tag in tagged_tokens])]
+
+
+def test_pos_pattern_matcher():
+    import random
+    import nltk
+    patterns = ['<VBG>? <JJ>* <NN|NNP|NNS>+', '<VBG|VBN>+ (<JJ> (<CC> <JJ>)*)+ <NN|NNP|NNS>', '<NN.*> <IN> <DT>? <NN>',
+                '<JJ>*']
+    tags = ['NN', 'NNS', 'NNP', 'JJ', 'VBG', 'VBN', 'CC', 'DT', 'IN', 'XYZ']
+    matcher = PosPatternMatcher(patterns)
+    parsers = [nltk.RegexpParser('TermCandidate: {%s}' % pattern) for pattern in patterns]
+    for i in range(1000):
+        tagged_tokens = [('w%d' % position, random.choice(tags)) for position in range(random.randint(1, 20))]
+        expected = sorted(tuple(node.leaves()) for parser in parsers for node in parser.parse(tagged_tokens)
+                          if type(node) is nltk.Tree and node.label() == 'TermCandidate' and len(node) > 0)
+        assert sorted(tuple(matched) for matched in matcher.match(tagged_tokens)) == expected
+    print("POS pattern matching is consistent with RegexpParser.")
+
+
+if __name__ == '__main__':
+    test_pos_pattern_matcher()
@@ -0,0 +1,85 @@
+"""
+Subsumption (term nesting) index for C-Value ranking
+"""
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+from util import TermUtil
+
+
+class SubsumptionIndex(object):
+    """
+    Inverted index from each normalised token to the candidates containing it.
+
+    Longer terms containing a term T are given by the intersection of the posting lists of T's tokens, which
+    replaces the pairwise comparison of T with every candidate. The result is identical to the containment test of
+    CValueRanker.get_longer_terms (i.e., the token set of the normalised term is a subset of the token set of the
+    normalised longer term, and both term surface forms and normalised forms are different).
+
+    Candidates are keyed by candidate id (position in the candidate vocabulary), and the surface forms, normalised
+    forms and posting lists are read from the memory mapped files of a CandidateStore (see
+    CandidateStore.write_term_statistics). The index can be shared with ranking workers (e.g., as pool initializer
+    argument) by sending the run directory of the store only.
+    """
+
+    def __init__(self, candidate_store):
+        """
+        params:
+            candidate_store, CandidateStore with the term statistics of all candidates
+        """
+        self.candidate_store = candidate_store
+
+    def __len__(self):
+        return len(self.candidate_store)
+
+    def posting_list(self, token):
+        """
+        return memoryview, ids of candidates containing the normalised token in ascending order, or None if no
+                candidate contains the token
+        """
+        position = self.candidate_store.tokens.position(token)
+        if position < 0:
+            return None
+        posting_offsets = self.candidate_store.posting_offsets
+        return self.candidate_store.postings[posting_offsets[position]:posting_offsets[position + 1]]
+
+    def longer_term_ids(self, term):
+        """
+        return list, ids (position in candidates) of candidates containing the term in ascending order
+        """
+        return self._longer_term_ids(term, TermUtil.normalise(term))
+
+    def candidate_longer_term_ids(self, candidate_id):
+        """
+        return list, ids of candidates containing the candidate of the given id in ascending order
+        """
+        return self._longer_term_ids(self.candidate_store.candidates.term(candidate_id),
+                                     self.candidate_store.normed_candidates.term(candidate_id))
+
+    def _longer_term_ids(self, term, normed_term):
+        posting_lists = []
+        for token in set(normed_term.split(' ')):
+            posting_list = self.posting_list(token)
+            if posting_list is None:
+                return []
+            posting_lists.append(posting_list)
+
+        posting_lists.sort(key=len)
+        candidate_ids = set(posting_lists[0])
+        for posting_list in posting_lists[1:]:
+            candidate_ids.intersection_update(posting_list)
+            if not candidate_ids:
+                return []
+
+        candidates = self.candidate_store.candidates
+        normed_candidates = self.candidate_store.normed_candidates
+        return sorted(candidate_id for candidate_id in candidate_ids
+                      if candidates.term(candidate_id) != term and normed_candidates.term(candidate_id) != normed_term)
+
+    def longer_terms(self, term):
+        """
+        return list, candidates (surface form) containing the term
+        """
+        candidates = self.candidate_store.candidates
+        return [candidates.term(candidate_id) for candidate_id in self.longer_term_ids(term)]
@@ -0,0 +1,135 @@
+"""
+In-process replica of the recommended Solr 'industry_term_normaliser' analyser chain:
+
+    solr.StandardTokenizerFactory -> solr.LowerCaseFilterFactory -> solr.ASCIIFoldingFilterFactory ->
+    solr.EnglishMinimalStemFilterFactory
+
+The replica allows term normalisation without a Field Analysis request per term. It follows the Unicode word
+break rules (UAX#29) used by Lucene StandardTokenizer for letters, digits and the usual mid-word punctuation,
+which covers the text we index. Exotic scripts may still diverge from Solr, which is why the normaliser can be
+run in "verify" mode (see SolrClient.get_industry_term_field_analysis) to sample terms against the live
+/analysis/field handler.
+"""
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import re
+import unicodedata
+
+# increase when the replica changes so that cached normalised forms are invalidated
+LOCAL_NORMALISER_VERSION = "1"
+
+_IDEOGRAPHIC = '㐀-䶿一-鿿豈-﫿'
+# letters and digits, excluding ideographs which StandardTokenizer emits one per token
+_WORD_CHAR = r'(?:[^\W_%s]|_)' % _IDEOGRAPHIC
+# MidLetter + MidNumLet: joins letters, e.g., "U.S.A", "don't"
+_MID_LETTER = ':··״‧︓﹕：' + '.\'‘’․﹒＇．'
+# MidNum + MidNumLet: joins digits, e.g., "1,000", "0.8"
+_MID_NUM = ',;;։،؍٬߸⁄︐︔﹐﹔，；' + \
+           '.\'‘’․﹒＇．'
+
+STANDARD_TOKEN_PATTERN = re.compile(r"""
+    [%(ideographic)s]
+    |%(word)s+
+    (?:
+        (?:(?<=[^\W\d_])[%(mid_letter)s](?=[^\W\d_])|(?<=\d)[%(mid_num)s](?=\d))
+        %(word)s+
+    )*
+    """ % {'ideographic': _IDEOGRAPHIC, 'word': _WORD_CHAR,
+           'mid_letter': re.escape(_MID_LETTER), 'mid_num': re.escape(_MID_NUM)}, re.VERBOSE)
+
+# StandardTokenizer default maxTokenLength
+MAX_TOKEN_LENGTH = 255
+
+# characters that are not decomposed by NFKD but are folded by Lucene ASCIIFoldingFilter
+_ASCII_FOLDING_TABLE = str.maketrans({
+    'ß': 'ss', 'æ': 'ae', 'Æ': 'AE', 'ø': 'o', 'Ø': 'O', 'œ': 'oe', 'Œ': 'OE',
+    'ł': 'l', 'Ł': 'L', 'đ': 'd', 'Đ': 'D', 'ð': 'd', 'Ð': 'D', 'þ': 'th',
+    'Þ': 'TH', 'ı': 'i', 'ħ': 'h', 'Ħ': 'H', 'ŧ': 't', 'Ŧ': 'T', 'ŋ': 'n',
+    '‘': "'", '’': "'", '‚': "'", '‛': "'", '′': "'",
+    '“': '"', '”': '"', '„': '"', '″': '"',
+    '‐': '-', '‑': '-', '‒': '-', '–': '-', '—': '-', '―': '-',
+})
+
+
+def standard_tokenize(text):
+    """
+    split text into word tokens as solr.StandardTokenizerFactory
+    return list, tokens
+    """
+    return [token for token in STANDARD_TOKEN_PATTERN.findall(text)
+            if len(token) <= MAX_TOKEN_LENGTH and token.strip('_')]
+
+
+def ascii_folding(token):
+    """
+    fold non-ASCII characters into their ASCII equivalents as solr.ASCIIFoldingFilterFactory
+    """
+    try:
+        token.encode('ascii')
+        return token
+    except UnicodeEncodeError:
+        pass
+
+    decomposed = unicodedata.normalize('NFKD', token.translate(_ASCII_FOLDING_TABLE))
+    return ''.join(c for c in decomposed if not unicodedata.combining(c))
+
+
+def english_minimal_stem(token):
+    """
+    Minimal plural stemmer for English as org.apache.lucene.analysis.en.EnglishMinimalStemmer
+
+    This stemmer implements the "S-Stemmer" from "How Effective Is Suffixing?" Donna Harman.
+    """
+    length = len(token)
+    if length < 3 or token[-1] != 's':
+        return token
+
+    penultimate = token[-2]
+    if penultimate == 'u' or penultimate == 's':
+        return token
+
+    if penultimate == 'e':
+        if length > 3 and token[-3] == 'i' and token[-4] != 'a' and token[-4] != 'e':
+            # "ies" -> "y"
+            return token[:-3] + 'y'
+        if token[-3] in ('i', 'a', 'o', 'e'):
+            return token
+
+    return token[:-1]
+
+
+class LocalTermNormaliser(object):
+    """
+    pure-Python normaliser equivalent to the 'industry_term_normaliser' field type analyser
+    """
+
+    def __init__(self, field_type="industry_term_normaliser"):
+        self.field_type = field_type
+        self.version = LOCAL_NORMALISER_VERSION
+
+    def tokens(self, term):
+        """
+        return list, normalised tokens (i.e., the output of EnglishMinimalStemFilter)
+        """
+        return [english_minimal_stem(ascii_folding(token.lower())) for token in standard_tokenize(term)]
+
+    def normalise(self, term):
+        """
+        return string, normalised term with tokens joined by a single whitespace
+        """
+        return ' '.join(self.tokens(term))
+
+    __call__ = normalise
+
+
+def test_local_term_normaliser():
+    normaliser = LocalTermNormaliser()
+    for term in ["subjective assessments", "manganese-alumino-silicates", "U.S.A.", "Longitudinal S prints",
+                 "non-metallic inclusions", "B219 steel code", "final US rate of 0.8%", "cafés", "Ladle lids"]:
+        print("[%s] -> [%s]" % (term, normaliser.normalise(term)))
+
+
+if __name__ == '__main__':
+    test_local_term_normaliser()
@@ -7,6 +7,7 @@ NodeCount = 0
 WordCount = 0
 
 from collections import OrderedDict
+from collections import deque
 def load_dict_from_csv(dict_csv_file):
     import csv
     with open(dict_csv_file, 'r', encoding='utf-8') as in_f:
@@ -56,6 +57,9 @@ class TrieNode:
 # maximum distance from the target word
 def search( word, maxCost, trie):
 
+    if isinstance(trie, CompactTrie):
+        return trie.search(word, maxCost)
+
     # build first row
     currentRow = range( len(word) + 1 )
 
@@ -100,6 +104,138 @@ def searchRecursive( node, letter, word, previousRow, results, maxCost ):
         for letter in node.children:
             searchRecursive( node.children[letter], letter, word, currentRow, 
                 results, maxCost )
+
+class CompactTrie(object):
+    """
+    Array-backed trie of the same words as TrieNode
+
+    Nodes are laid out in breadth first order, so the children of node i are the contiguous nodes
+    [child_start[i], child_start[i + 1]) (in the insertion order of TrieNode.children). Labels are kept in one
+    string and words in one list, which makes the trie cheap to pickle and ship to pool workers.
+
+    The search is an iterative depth first traversal with a preallocated Levenshtein row per depth, and returns
+    the same matches in the same order as search(word, maxCost, TrieNode). The number of nodes visited by all
+    searches (i.e., Levenshtein rows computed) is counted in visited_nodes.
+    """
+
+    def __init__(self, words=()):
+        root = TrieNode()
+        for word in words:
+            root.insert(word)
+        self._build(root)
+
+    @classmethod
+    def from_trie(cls, root):
+        """
+        compact an existing TrieNode
+        """
+        trie = cls.__new__(cls)
+        trie._build(root)
+        return trie
+
+    def _build(self, root):
+        from array import array
+
+        # root label is a placeholder (never compared)
+        labels = ['\0']
+        words = [root.word]
+        child_start = array('i', [1])
+        max_depth = 0
+
+        # breadth first: children of every node are appended contiguously
+        queue = deque([(root, 0)])
+        while queue:
+            node, depth = queue.popleft()
+            for letter, child in node.children.items():
+                labels.append(letter)
+                words.append(child.word)
+                queue.append((child, depth + 1))
+                max_depth = max(max_depth, depth + 1)
+            child_start.append(len(labels))
+
+        self.labels = ''.join(labels)
+        self.words = words
+        self.child_start = child_start
+        self.max_depth = max_depth
+        self.visited_nodes = 0
+
+    def __len__(self):
+        return len(self.labels)
+
+    def search(self, word, maxCost):
+        """
+        return list, (word, distance) of all the words within maximum Levenshtein distance from the given word
+        """
+        labels, words, child_start = self.labels, self.words, self.child_start
+        columns = len(word) + 1
+
+        # rows[d] is the Levenshtein row of the node at depth d on current path
+        rows = [None] * (self.max_depth + 1)
+        rows[0] = list(range(columns))
+        for depth in range(1, self.max_depth + 1):
+            rows[depth] = [0] * columns
+
+        results = []
+        visited_nodes = 0
+        # (node, depth), children are pushed in reverse order to visit them in insertion order
+        stack = [(node, 1) for node in range(child_start[1] - 1, child_start[0] - 1, -1)]
+        while stack:
+            node, depth = stack.pop()
+            visited_nodes += 1
+            letter = labels[node]
+            previousRow = rows[depth - 1]
+            currentRow = rows[depth]
+
+            currentRow[0] = previousRow[0] + 1
+            row_min = currentRow[0]
+            for column in range(1, columns):
+                cost = previousRow[column - 1] if word[column - 1] == letter else previousRow[column - 1] + 1
+                insertCost = currentRow[column - 1] + 1
+                if insertCost < cost:
+                    cost = insertCost
+                deleteCost = previousRow[column] + 1
+                if deleteCost < cost:
+                    cost = deleteCost
+                currentRow[column] = cost
+                if cost < row_min:
+                    row_min = cost
+
+            if currentRow[-1] <= maxCost and words[node] is not None:
+                results.append((words[node], currentRow[-1]))
+
+            if row_min <= maxCost:
+                stack.extend((child, depth + 1) for child in
+                             range(child_start[node + 1] - 1, child_start[node] - 1, -1))
+
+        self.visited_nodes += visited_nodes
+        return results
+
+
+def test_compact_trie():
+    import random
+    letters = 'abcde'
+    words = [''.join(random.choice(letters) for i in range(random.randint(1, 8))) for j in range(2000)]
+    trie = TrieNode()
+    for word in words:
+        trie.insert(word)
+    compact_trie = CompactTrie.from_trie(trie)
+
+    for i in range(200):
+        target = ''.join(random.choice(letters) for i in range(random.randint(1, 8)))
+        assert search(target, 2, trie) == compact_trie.search(target, 2)
+    print("compact trie search is consistent with TrieNode search.")
+
+    import pickle
+    print("pickled size: TrieNode [%s] bytes, CompactTrie [%s] bytes" % (len(pickle.dumps(trie)),
+                                                                       len(pickle.dumps(compact_trie))))
+
+    start = time.time()
+    [search(word, 3, trie) for word in words[:200]]
+    print("TrieNode search took %g s" % (time.time() - start))
+    start = time.time()
+    [compact_trie.search(word, 3) for word in words[:200]]
+    print("CompactTrie search took %g s" % (time.time() - start))
+
 '''
 start = time.time()
 results = search("TR", 3, trie)
@@ -111,4 +247,7 @@ for result in results:
 print("Search took %g s" % (end - start))
 '''
 
-#print(levenshtein_similarity('O\'Nell', 'O Nell'))
\ No newline at end of file
+#print(levenshtein_similarity('O\'Nell', 'O Nell'))
+
+if __name__ == '__main__':
+    test_compact_trie()
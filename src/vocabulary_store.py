@@ -0,0 +1,223 @@
+"""
+Compact on-disk term vocabulary with document frequencies, read by memory mapping
+
+File layout (integers are 64-bit in the byte order of the machine which wrote the file):
+    header, magic (8 bytes), byte order (8 bytes, b'little\\0\\0' or b'big\\0\\0\\0\\0\\0'), number of terms n,
+            length of term blob, sorted flag (1 if terms are in ascending UTF-8 byte order)
+    offsets, n + 1 int64, start of every term in term blob (and end of the last term)
+    dfs, n int64, document frequency of every term
+    term blob, UTF-8 encoded terms concatenated
+
+Terms are read on demand from the mapped file, so a vocabulary of millions of terms does not need to be loaded in
+memory and the same pages are shared by every process (e.g., pool workers) reading the file.
+"""
+import sys
+import os
+sys.path.append(os.path.join(os.path.dirname(__file__), '..'))
+
+import logging
+import mmap
+import shutil
+import struct
+import tempfile
+from array import array
+
+MAGIC = b'TRVOCAB1'
+_HEADER = struct.Struct('=8s8sqqq')
+
+
+class VocabularyStore(object):
+    """
+    Read-only (term, df) vocabulary mapped from a vocabulary file (see VocabularyStore.write)
+
+    The store can be used as a read-only mapping of term -> df (e.g., as all candidates of C-Value ranking):
+    iteration gives terms in file order, and lookup is a binary search over terms sorted in UTF-8 byte order (the
+    index order of Solr terms component). Pickling a store (e.g., as pool initializer argument) sends the file path
+    only, and the file is mapped again in the receiving process.
+    """
+
+    def __init__(self, path):
+        self._logger = logging.getLogger(__name__)
+        self.path = path
+
+        self._file = open(path, 'rb')
+        try:
+            self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            # empty file cannot be mapped
+            self._file.close()
+            raise Exception("[%s] is not a vocabulary file!" % path)
+
+        magic, byteorder, self._size, blob_length, is_sorted = _HEADER.unpack_from(self._mmap, 0)
+        if magic != MAGIC:
+            self.close()
+            raise Exception("[%s] is not a vocabulary file!" % path)
+        if byteorder.rstrip(b'\0').decode('ascii') != sys.byteorder:
+            self.close()
+            raise Exception("vocabulary file [%s] is written in different byte order!" % path)
+        self.is_sorted = bool(is_sorted)
+
+        offsets_start = _HEADER.size
+        dfs_start = offsets_start + 8 * (self._size + 1)
+        self._blob_start = dfs_start + 8 * self._size
+
+        view = memoryview(self._mmap)
+        self._offsets = view[offsets_start:dfs_start].cast('q')
+        self._dfs = view[dfs_start:self._blob_start].cast('q')
+        view.release()
+
+        # term -> position of unsorted vocabulary, built on first lookup
+        self._positions = None
+
+    @staticmethod
+    def write(path, term_dfs):
+        """
+        write (term, df) pairs into a vocabulary file
+
+        Terms are streamed into a temporary blob file next to the vocabulary file, so only two int64 per term are
+        kept in memory while writing.
+        params:
+            path, vocabulary file path
+            term_dfs, iterable of (term, df), e.g., SolrClient.scan_field_terms
+        return int, number of terms written
+        """
+        offsets = array('q', [0])
+        dfs = array('q')
+        is_sorted = True
+        previous = None
+
+        directory = os.path.dirname(os.path.abspath(path))
+        with tempfile.TemporaryFile(dir=directory) as blob_file:
+            for term, df in term_dfs:
+                encoded = term.encode('utf-8')
+                if previous is not None and encoded <= previous:
+                    is_sorted = False
+                previous = encoded
+
+                blob_file.write(encoded)
+                offsets.append(offsets[-1] + len(encoded))
+                dfs.append(df)
+
+            tmp_path = path + '.tmp'
+            with open(tmp_path, 'wb') as vocabulary_file:
+                vocabulary_file.write(_HEADER.pack(MAGIC, sys.byteorder.encode('ascii'), len(dfs), offsets[-1],
+                                                   1 if is_sorted else 0))
+                offsets.tofile(vocabulary_file)
+                dfs.tofile(vocabulary_file)
+                blob_file.seek(0)
+                shutil.copyfileobj(blob_file, vocabulary_file)
+            os.replace(tmp_path, path)
+
+        return len(dfs)
+
+    @classmethod
+    def build(cls, path, term_dfs):
+        """
+        write (term, df) pairs into a vocabulary file and map it
+        return VocabularyStore
+        """
+        cls.write(path, term_dfs)
+        return cls(path)
+
+    def __len__(self):
+        return self._size
+
+    def _term_bytes(self, position):
+        return self._mmap[self._blob_start + self._offsets[position]:self._blob_start + self._offsets[position + 1]]
+
+    def term(self, position):
+        return self._term_bytes(position).decode('utf-8')
+
+    def df(self, position):
+        return self._dfs[position]
+
+    def df_column(self):
+        """
+        return memoryview, int64 document frequencies in term order, read from the mapped file without copying
+                (e.g., by numpy.frombuffer)
+        """
+        return self._dfs
+
+    def __iter__(self):
+        for position in range(self._size):
+            yield self.term(position)
+
+    def keys(self):
+        return iter(self)
+
+    def items(self):
+        """
+        return generator of (term, df)
+        """
+        for position in range(self._size):
+            yield self.term(position), self._dfs[position]
+
+    def position(self, term):
+        """
+        return int, position of the term, or -1 if the term is not in vocabulary
+        """
+        if not self.is_sorted:
+            if self._positions is None:
+                self._positions = dict((vocabulary_term, position) for position, vocabulary_term in enumerate(self))
+            return self._positions.get(term, -1)
+
+        encoded = term.encode('utf-8')
+        low, high = 0, self._size
+        while low < high:
+            middle = (low + high) // 2
+            if self._term_bytes(middle) < encoded:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self._size and self._term_bytes(low) == encoded:
+            return low
+        return -1
+
+    def __contains__(self, term):
+        return self.position(term) >= 0
+
+    def __getitem__(self, term):
+        position = self.position(term)
+        if position < 0:
+            raise KeyError(term)
+        return self._dfs[position]
+
+    def get(self, term, default=None):
+        position = self.position(term)
+        return self._dfs[position] if position >= 0 else default
+
+    def close(self):
+        if self._mmap is not None:
+            if hasattr(self, '_offsets'):
+                self._offsets.release()
+                self._dfs.release()
+            self._mmap.close()
+            self._file.close()
+            self._mmap = None
+
+    def __getstate__(self):
+        return {'path': self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state['path'])
+
+
+def test_vocabulary_store():
+    import pickle
+    terms = [('bloom', 3), ('rail steel', 12), ('steel', 40), ('étude', 1)]
+    path = os.path.join(tempfile.gettempdir(), 'test_vocabulary.bin')
+
+    vocabulary = VocabularyStore.build(path, terms)
+    print(len(vocabulary), vocabulary.is_sorted, list(vocabulary.items()))
+    print('steel' in vocabulary, vocabulary['rail steel'], vocabulary.get('slab'))
+    print(list(pickle.loads(pickle.dumps(vocabulary))))
+    vocabulary.close()
+
+    vocabulary = VocabularyStore.build(path, reversed(terms))
+    print(vocabulary.is_sorted, vocabulary['bloom'], 'slab' in vocabulary)
+    vocabulary.close()
+    os.remove(path)
+
+
+if __name__ == '__main__':
+    test_vocabulary_store()